@@ -53,8 +53,7 @@ cp -n resources/config.ini $telegram_plus_dir
 grep -qF -- "version" $telegram_plus_dir/config.ini || sed -i "s|\[telegram_bot\]|\[telegram_bot\]\nversion = v0.0.0|g" $telegram_plus_dir/config.ini
 sed -i "s|.*version.*|version = $bot_version|g" $telegram_plus_dir/config.ini
 
-cp resources/telegram_bot.py $telegram_plus_dir
-cp resources/fqueue.py $telegram_plus_dir
+cp resources/*.py $telegram_plus_dir
 cp resources/checkmk-telegram-plus.service /etc/systemd/system/$telegram_plus_service_name
 
 chown -R $omd_site:$omd_site $telegram_plus_dir
@@ -0,0 +1,112 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+# Parts of the plugin output which change with every check, e.g. timestamps,
+# durations, IP addresses and measured values. They are masked, so that the
+# same problem always gets the same signature.
+output_masks = [
+    (re.compile(r"\d{4}-\d\d-\d\d([ T]\d\d:\d\d(:\d\d)?(\.\d+)?)?"), "<time>"),
+    (re.compile(r"\b\d\d?:\d\d(:\d\d)?\b"), "<time>"),
+    (re.compile(r"\b\d{1,3}(\.\d{1,3}){3}\b"), "<ip>"),
+    (re.compile(r"\d+([.,]\d+)?"), "<n>"),
+]
+
+
+# Method to get the signature of a problem from the name of the service, the
+# state transition and the plugin output. Problems with the same signature
+# get the same answer, regardless of the host and of the measured values.
+def get_signature(service, from_state, to_state, output, hostname=None):
+    output = output.strip().lower()
+
+    # The host name is masked first, as it may contain numbers itself
+    if hostname:
+        output = output.replace(hostname.lower(), "<host>")
+
+    for pattern, replacement in output_masks:
+        output = pattern.sub(replacement, output)
+
+    output = " ".join(output.split())
+
+    return hashlib.sha256(
+        "\0".join([service, f"{from_state}->{to_state}", output]).encode("utf-8")
+    ).hexdigest()
+
+
+class AICache(object):
+    def __init__(self, path, ttl=30 * 24 * 3600) -> None:
+        self.path = path
+        self.ttl = ttl
+
+        # The database is only used from worker threads, one at a time
+        self.connection = None
+        self.lock = threading.Lock()
+        self.last_cleanup = 0
+
+    def get_connection(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    signature TEXT PRIMARY KEY,
+                    answer TEXT NOT NULL,
+                    time REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+
+        return self.connection
+
+    # Method to get the answer for a signature. Returns None if there is no
+    # answer or if it is older than the ttl. This accesses the disk, so it
+    # should be executed in a worker thread.
+    def get(self, signature):
+        with self.lock:
+            connection = self.get_connection()
+            row = connection.execute(
+                "SELECT answer FROM answers WHERE signature = ? AND time >= ?",
+                (signature, time.time() - self.ttl),
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            connection.execute(
+                "UPDATE answers SET hits = hits + 1 WHERE signature = ?",
+                (signature,),
+            )
+            connection.commit()
+
+            return row[0]
+
+    # Method to store the answer for a signature. This accesses the disk, so
+    # it should be executed in a worker thread.
+    def put(self, signature, answer):
+        with self.lock:
+            connection = self.get_connection()
+            now = time.time()
+
+            connection.execute(
+                "INSERT OR REPLACE INTO answers (signature, answer, time) "
+                "VALUES (?, ?, ?)",
+                (signature, answer, now),
+            )
+
+            # Expired answers are removed once per hour
+            if now - self.last_cleanup > 3600:
+                connection.execute(
+                    "DELETE FROM answers WHERE time < ?", (now - self.ttl,)
+                )
+                self.last_cleanup = now
+
+            connection.commit()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
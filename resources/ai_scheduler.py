@@ -0,0 +1,165 @@
+import asyncio
+from collections import OrderedDict, deque
+
+
+class AIOverloadError(Exception):
+    pass
+
+
+class AIRequest(object):
+    def __init__(self, key, user) -> None:
+        self.key = key
+        self.user = user
+        self.started = asyncio.get_running_loop().create_future()
+        self.task = None
+        self.position = None
+        # (on_output, on_position) callbacks of everyone who waits for the
+        # answer of this request
+        self.listeners = []
+
+
+class AIScheduler(object):
+    def __init__(self, concurrency=2, max_queue=20, max_requests_per_user=3) -> None:
+        # Maximum number of requests which are sent to the AI at the same time
+        self.concurrency = concurrency
+        # Requests are rejected if this many requests are already waiting or
+        # if the user already has this many requests
+        self.max_queue = max_queue
+        self.max_requests_per_user = max_requests_per_user
+
+        self.running = 0
+        # user -> requests of the user which are waiting, in the order in
+        # which the users get their next turn
+        self.waiting = OrderedDict()
+        # key -> request which is waiting or running
+        self.requests = {}
+        self.notifications = set()
+
+    # Method to run a request to the AI. job(publish) is awaited once a slot
+    # is free and should call publish(text) with the partial output. Requests
+    # with the same key, which are waiting or running, are only executed once
+    # and all callers get the same output and result. on_position(position) is
+    # called while the request is waiting. Raises AIOverloadError if the
+    # request can not be queued.
+    async def run(self, user, key, job, on_output=None, on_position=None):
+        request = self.requests.get(key)
+
+        if request is None:
+            if sum(len(queue) for queue in self.waiting.values()) >= self.max_queue:
+                raise AIOverloadError(
+                    "Too many questions are waiting for the AI at the moment. "
+                    "Please try again in a few minutes."
+                )
+
+            if (
+                sum(1 for other in self.requests.values() if other.user == user)
+                >= self.max_requests_per_user
+            ):
+                raise AIOverloadError(
+                    "You already have too many questions waiting for the AI. "
+                    "Please wait until they are answered."
+                )
+
+            request = AIRequest(key, user)
+            request.task = asyncio.create_task(self.execute(request, job))
+            self.requests[key] = request
+            self.waiting.setdefault(user, deque()).append(request)
+            self.dispatch()
+
+        listener = (on_output, on_position)
+        request.listeners.append(listener)
+
+        try:
+            if not request.started.done() and on_position is not None:
+                await on_position(request.position)
+
+            # The request is shared, so it is only cancelled when nobody
+            # waits for it any longer
+            return await asyncio.shield(request.task)
+        except asyncio.CancelledError:
+            request.listeners.remove(listener)
+            if not request.listeners:
+                request.task.cancel()
+            raise
+
+    async def execute(self, request, job):
+        try:
+            await request.started
+        except asyncio.CancelledError:
+            del self.requests[request.key]
+
+            # The request may have got a slot just before it was cancelled,
+            # in this case the slot is given to the next request. Otherwise
+            # the future was cancelled together with the task.
+            if request.started.done() and not request.started.cancelled():
+                self.running -= 1
+                self.dispatch()
+                raise
+
+            queue = self.waiting[request.user]
+            queue.remove(request)
+            if not queue:
+                del self.waiting[request.user]
+
+            self.update_positions()
+            raise
+
+        try:
+            return await job(lambda text: self.publish(request, text))
+        finally:
+            self.running -= 1
+            del self.requests[request.key]
+            self.dispatch()
+
+    async def publish(self, request, text):
+        await asyncio.gather(
+            *[
+                on_output(text)
+                for on_output, _ in list(request.listeners)
+                if on_output is not None
+            ],
+            return_exceptions=True,
+        )
+
+    # Method to start the waiting requests while slots are free. The users
+    # take turns, so that a user with many requests can not delay the
+    # requests of the other users.
+    def dispatch(self):
+        while self.running < self.concurrency and self.waiting:
+            user, queue = self.waiting.popitem(last=False)
+            request = queue.popleft()
+
+            # The user gets the next turn after all other waiting users
+            if queue:
+                self.waiting[user] = queue
+
+            self.running += 1
+            request.started.set_result(None)
+
+        self.update_positions()
+
+    # Method to tell the waiting callers their new position in the queue,
+    # which is the order in which the users take turns
+    def update_positions(self):
+        queues = list(self.waiting.values())
+        position = 0
+
+        for index in range(max((len(queue) for queue in queues), default=0)):
+            for queue in queues:
+                if index >= len(queue):
+                    continue
+
+                position += 1
+                request = queue[index]
+                if request.position == position:
+                    continue
+
+                request.position = position
+                for _, on_position in request.listeners:
+                    if on_position is not None:
+                        self.notify(on_position(position))
+
+    def notify(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.notifications.add(task)
+        task.add_done_callback(self.notifications.discard)
@@ -0,0 +1,415 @@
+import asyncio
+import heapq
+import json
+import time
+
+
+class LivestatusError(Exception):
+    pass
+
+
+# Tables and columns which may be queried by the bot
+ALLOWED_COLUMNS = {
+    "hostgroups": {"name", "alias", "members", "num_hosts"},
+    "hosts": {
+        "name",
+        "alias",
+        "address",
+        "state",
+        "groups",
+        "plugin_output",
+        "last_check",
+        "last_state_change",
+        "acknowledged",
+        "scheduled_downtime_depth",
+    },
+    "services": {
+        "host_name",
+        "description",
+        "state",
+        "host_groups",
+        "perf_data",
+        "plugin_output",
+        "long_plugin_output",
+        "last_check",
+        "last_state_change",
+        "acknowledged",
+        "scheduled_downtime_depth",
+        "active_checks_enabled",
+    },
+}
+ALLOWED_COLUMNS["hostsbygroup"] = ALLOWED_COLUMNS["hosts"] | {"hostgroup_name"}
+ALLOWED_COLUMNS["servicesbyhostgroup"] = ALLOWED_COLUMNS["services"] | {
+    "hostgroup_name"
+}
+
+ALLOWED_OPERATORS = {
+    "=",
+    "!=",
+    "<",
+    ">",
+    "<=",
+    ">=",
+    "~",
+    "!~",
+    "=~",
+    "!=~",
+    "~~",
+    "!~~",
+}
+
+
+class Query(object):
+    def __init__(self, table, limit=1000) -> None:
+        if table not in ALLOWED_COLUMNS:
+            raise LivestatusError(f"The table '{table}' is not allowed")
+
+        self.table = table
+        self.limit = limit
+        self.column_names = []
+        self.headers = []
+
+    def check_column(self, column):
+        if column not in ALLOWED_COLUMNS[self.table]:
+            raise LivestatusError(
+                f"The column '{column}' is not allowed for the table '{self.table}'"
+            )
+
+    def escape(self, value):
+        # Livestatus has no way to escape line breaks in a header. A value
+        # containing one could add further headers to the query, so values
+        # with control characters are rejected.
+        value = str(value)
+
+        if any(ord(character) < 32 for character in value):
+            raise LivestatusError("The value contains invalid characters")
+
+        return value
+
+    def columns(self, *columns):
+        for column in columns:
+            self.check_column(column)
+            self.column_names.append(column)
+
+        return self
+
+    def filter(self, column, operator, value):
+        self.check_column(column)
+
+        if operator not in ALLOWED_OPERATORS:
+            raise LivestatusError(f"The operator '{operator}' is not allowed")
+
+        self.headers.append(f"Filter: {column} {operator} {self.escape(value)}")
+        return self
+
+    def filter_or(self, count):
+        self.headers.append(f"Or: {int(count)}")
+        return self
+
+    def filter_and(self, count):
+        self.headers.append(f"And: {int(count)}")
+        return self
+
+    def stats(self, column, operator, value):
+        self.check_column(column)
+
+        if operator not in ALLOWED_OPERATORS:
+            raise LivestatusError(f"The operator '{operator}' is not allowed")
+
+        self.headers.append(f"Stats: {column} {operator} {self.escape(value)}")
+        return self
+
+    def stats_and(self, count):
+        self.headers.append(f"StatsAnd: {int(count)}")
+        return self
+
+    def stats_or(self, count):
+        self.headers.append(f"StatsOr: {int(count)}")
+        return self
+
+    def __str__(self):
+        query = [f"GET {self.table}", *self.headers]
+
+        if self.column_names:
+            query.append(f"Columns: {' '.join(self.column_names)}")
+        if self.limit is not None:
+            query.append(f"Limit: {int(self.limit)}")
+
+        return "\n".join(query) + "\n"
+
+
+class LivestatusClient(object):
+    def __init__(
+        self,
+        socket_path,
+        pool_size=4,
+        timeout=10,
+        logger=None,
+        slow_query_threshold=1,
+    ) -> None:
+        # The socket path is given in the same format as for the livestatus
+        # module of Check_MK: "unix:/path/to/socket" or "tcp:host:port"
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        # Queries which take longer than the threshold (in seconds) are
+        # logged as a warning, all others with the debug level
+        self.logger = logger
+        self.slow_query_threshold = slow_query_threshold
+
+        self.idle_connections = []
+        self.semaphore = None
+
+    def get_semaphore(self):
+        # The semaphore must be created within the running event loop
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.pool_size)
+
+        return self.semaphore
+
+    async def open_connection(self):
+        if self.socket_path.startswith("unix:"):
+            return await asyncio.open_unix_connection(self.socket_path[5:])
+
+        if self.socket_path.startswith("tcp:"):
+            host, port = self.socket_path[4:].rsplit(":", 1)
+            return await asyncio.open_connection(host, int(port))
+
+        raise LivestatusError(f"Invalid livestatus socket: {self.socket_path}")
+
+    def close_connection(self, connection):
+        reader, writer = connection
+        writer.close()
+
+    async def send_query(self, connection, query):
+        reader, writer = connection
+
+        writer.write(
+            (
+                f"{query.strip()}\n"
+                "OutputFormat: json\n"
+                "KeepAlive: on\n"
+                "ResponseHeader: fixed16\n\n"
+            ).encode("utf-8")
+        )
+        await writer.drain()
+
+        # The fixed16 header consists of the status code (3 bytes), a space,
+        # the length of the response (11 bytes) and a newline
+        header = await reader.readexactly(16)
+        status = int(header[0:3])
+        length = int(header[4:15])
+        body = await reader.readexactly(length)
+
+        if status != 200:
+            raise LivestatusError(
+                f"Livestatus error {status}: {body.decode('utf-8').strip()}"
+            )
+
+        return json.loads(body.decode("utf-8"))
+
+    async def run_query(self, query, reuse_connection):
+        if reuse_connection and self.idle_connections:
+            connection = self.idle_connections.pop()
+        else:
+            connection = await self.open_connection()
+
+        try:
+            rows = await self.send_query(connection, query)
+        except BaseException:
+            # The state of the connection is unknown after an error (e.g. a
+            # timeout in the middle of a response), so it is not reused
+            self.close_connection(connection)
+            raise
+
+        if len(self.idle_connections) < self.pool_size:
+            self.idle_connections.append(connection)
+        else:
+            self.close_connection(connection)
+
+        return rows
+
+    def log_query(self, query, duration, rows):
+        if self.logger is None:
+            return
+
+        log = (
+            self.logger.warning
+            if duration > self.slow_query_threshold
+            else self.logger.debug
+        )
+        log(
+            "Livestatus query took %.3fs and returned %d rows: %s",
+            duration,
+            rows,
+            " | ".join(query.strip().split("\n")),
+        )
+
+    async def query_table(self, query, timeout=None):
+        query = str(query)
+        started = time.monotonic()
+
+        async with self.get_semaphore():
+            try:
+                rows = await asyncio.wait_for(
+                    self.run_query(query, reuse_connection=True),
+                    timeout or self.timeout,
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # An idle connection may have been closed by the core in the
+                # meantime, so try again once with a new connection
+                rows = await asyncio.wait_for(
+                    self.run_query(query, reuse_connection=False),
+                    timeout or self.timeout,
+                )
+
+        self.log_query(query, time.monotonic() - started, len(rows))
+        return rows
+
+    def close(self):
+        while self.idle_connections:
+            self.close_connection(self.idle_connections.pop())
+
+
+class MultiSiteClient(object):
+    def __init__(self, clients, logger=None) -> None:
+        # site name -> LivestatusClient. Every client uses its own timeout,
+        # so a site which does not respond cannot delay the others for longer.
+        self.clients = clients
+        self.logger = logger
+
+    async def query_sites(self, query, sites=None, timeout=None):
+        sites = list(self.clients) if sites is None else sites
+
+        results = await asyncio.gather(
+            *[self.clients[site].query_table(query, timeout) for site in sites],
+            return_exceptions=True,
+        )
+
+        # The rows and errors are returned per site, so that the caller can
+        # report the sites which could not be reached
+        rows = {}
+        errors = {}
+        for site, result in zip(sites, results):
+            if isinstance(result, BaseException):
+                errors[site] = result
+            else:
+                rows[site] = result
+
+        return rows, errors
+
+    # Method to query all sites and merge their rows. Returns the rows and the
+    # names of the sites which could not be reached, so that the caller can
+    # tell the user that the result is not complete.
+    async def query_table_with_errors(
+        self, query, timeout=None, key=None, reverse=False
+    ):
+        rows, errors = await self.query_sites(query, timeout=timeout)
+
+        # Only fail if no site at all has answered
+        if errors and not rows:
+            raise next(iter(errors.values()))
+
+        if self.logger is not None:
+            for site, error in errors.items():
+                self.logger.warning(
+                    "Livestatus query to the site %s failed: %s", site, error
+                )
+
+        if key is None:
+            merged = [row for site in rows for row in rows[site]]
+        else:
+            merged = list(
+                heapq.merge(
+                    *[sorted(rows[site], key=key, reverse=reverse) for site in rows],
+                    key=key,
+                    reverse=reverse,
+                )
+            )
+
+        return merged, sorted(errors)
+
+    async def query_table(self, query, timeout=None, key=None, reverse=False):
+        rows, _ = await self.query_table_with_errors(query, timeout, key, reverse)
+        return rows
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+
+
+class QueryCache(object):
+    def __init__(self, client, ttls, default_ttl=0) -> None:
+        # The time to live (in seconds) of the cached results is defined per
+        # table, e.g. {"hostgroups": 60}. Tables without a TTL are not cached.
+        self.client = client
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+
+        self.results = {}
+        self.in_flight = {}
+
+    def normalize(self, query):
+        # Queries that only differ in whitespace or empty lines are the same
+        lines = [" ".join(line.split()) for line in query.strip().split("\n")]
+        return "\n".join(line for line in lines if line)
+
+    def get_ttl(self, query):
+        table = query.split("\n")[0].split(" ")[-1]
+        return self.ttls.get(table, self.default_ttl)
+
+    def store_result(self, query, ttl, future):
+        self.in_flight.pop(query, None)
+
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        # Results with missing sites are not kept, so that the next query
+        # asks the sites again
+        if future.result()[1]:
+            return
+
+        now = time.monotonic()
+
+        # Remove all expired results before a new one is added
+        expired = [key for key, (expires, _) in self.results.items() if expires < now]
+        for key in expired:
+            del self.results[key]
+
+        self.results[query] = (now + ttl, future.result())
+
+    # Method to get the rows of a query and the names of the sites which could
+    # not be reached. The client has to be a MultiSiteClient.
+    async def query_table_with_errors(self, query, timeout=None):
+        query = self.normalize(str(query))
+        ttl = self.get_ttl(query)
+
+        if ttl <= 0:
+            return await self.client.query_table_with_errors(query, timeout)
+
+        cached = self.results.get(query)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        # If the same query is already running, wait for its result instead
+        # of sending the query to the core again
+        future = self.in_flight.get(query)
+        if future is None:
+            future = asyncio.ensure_future(
+                self.client.query_table_with_errors(query, timeout)
+            )
+            future.add_done_callback(
+                lambda future: self.store_result(query, ttl, future)
+            )
+            self.in_flight[query] = future
+
+        # A cancelled caller must not cancel the query for everyone else
+        return await asyncio.shield(future)
+
+    async def query_table(self, query, timeout=None):
+        rows, _ = await self.query_table_with_errors(query, timeout)
+        return rows
+
+    def clear(self):
+        self.results = {}
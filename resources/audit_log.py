@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+import time
+
+
+class AuditLog(object):
+    def __init__(self, path, retention_days=90) -> None:
+        self.path = path
+        self.retention = retention_days * 24 * 3600
+
+        # The events are collected in memory and written in batches by
+        # flush(), so that recording an event never waits for the disk
+        self.pending = []
+        self.pending_lock = threading.Lock()
+
+        # The database is only used from worker threads, one at a time
+        self.connection = None
+        self.connection_lock = threading.Lock()
+        self.last_cleanup = 0
+
+    def get_connection(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY,
+                    time REAL NOT NULL,
+                    user_id INTEGER,
+                    username TEXT,
+                    command TEXT NOT NULL,
+                    target TEXT,
+                    duration REAL,
+                    outcome TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS events_time ON events (time);
+                DROP INDEX IF EXISTS events_user;
+                CREATE INDEX IF NOT EXISTS events_username
+                    ON events (username COLLATE NOCASE, time);
+                CREATE INDEX IF NOT EXISTS events_command ON events (command, time);
+                CREATE INDEX IF NOT EXISTS events_outcome ON events (outcome, time);
+                """
+            )
+
+        return self.connection
+
+    # Method to record an event, e.g. a command of a user and whether it was
+    # successful ("ok"), failed ("error") or not allowed ("denied")
+    def record(self, user_id, username, command, target, duration, outcome):
+        with self.pending_lock:
+            self.pending.append(
+                (time.time(), user_id, username, command, target, duration, outcome)
+            )
+
+    # Method to write the recorded events to the database. This accesses the
+    # disk, so it should be executed in a worker thread.
+    def flush(self):
+        with self.pending_lock:
+            events, self.pending = self.pending, []
+
+        with self.connection_lock:
+            connection = self.get_connection()
+
+            if events:
+                connection.executemany(
+                    "INSERT INTO events "
+                    "(time, user_id, username, command, target, duration, outcome) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    events,
+                )
+
+            # Old events are removed once per hour
+            now = time.time()
+            if now - self.last_cleanup > 3600:
+                connection.execute(
+                    "DELETE FROM events WHERE time < ?", (now - self.retention,)
+                )
+                self.last_cleanup = now
+
+            connection.commit()
+
+    # Method to get the latest events, newest first. All filters are
+    # optional: the time (as timestamp) since which the events are returned,
+    # the user, the commands (list of names) and the outcome.
+    def query(
+        self, since=None, username=None, commands=None, outcome=None, limit=200
+    ):
+        # Events which were not written yet must also be found
+        self.flush()
+
+        conditions = []
+        parameters = []
+
+        if since is not None:
+            conditions.append("time >= ?")
+            parameters.append(since)
+        # Telegram usernames are case-insensitive
+        if username is not None:
+            conditions.append("username = ? COLLATE NOCASE")
+            parameters.append(username)
+        if commands:
+            conditions.append(f"command IN ({', '.join('?' for _ in commands)})")
+            parameters.extend(commands)
+        if outcome is not None:
+            conditions.append("outcome = ?")
+            parameters.append(outcome)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self.connection_lock:
+            return self.get_connection().execute(
+                "SELECT time, username, command, target, duration, outcome "
+                f"FROM events {where} ORDER BY time DESC LIMIT ?",
+                parameters + [limit],
+            ).fetchall()
+
+    def close(self):
+        with self.connection_lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,202 @@
+import abc
+import asyncio
+import os
+import time
+
+
+class CommandError(Exception):
+    pass
+
+
+class CommandWriter(abc.ABC):
+    def __init__(
+        self, timeout=10, max_batch=500, idle_timeout=60, logger=None
+    ) -> None:
+        self.timeout = timeout
+        # Maximum number of commands which are written at once
+        self.max_batch = max_batch
+        # Connections which were not used for this time (in seconds) are not
+        # trusted any longer, as the core may have closed them in the meantime
+        self.idle_timeout = idle_timeout
+        self.logger = logger
+
+        self.queue = None
+        self.task = None
+        self.connected = False
+        self.last_write = 0
+        # Number of bytes of the current batch which were written for sure.
+        # Only the rest is written again after an error, so that no command
+        # is executed twice.
+        self.written = 0
+
+    # Method to submit external commands to the core, e.g.
+    # "ACKNOWLEDGE_HOST_PROBLEM;myhost;2;0;0;admin;Comment". All commands which
+    # are submitted at the same time are written together. Returns as soon as
+    # the commands were written.
+    async def submit(self, *commands):
+        for command in commands:
+            if not command or any(character in command for character in "\r\n\0"):
+                raise CommandError(f"Invalid command: {command!r}")
+
+        # The queue and the writer are created within the running event loop
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self.run())
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((commands, future))
+        await future
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty() and len(batch) < self.max_batch:
+                batch.append(self.queue.get_nowait())
+
+            try:
+                await self.send(
+                    [command for commands, _ in batch for command in commands]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+    async def send(self, commands):
+        now = int(time.time())
+        data = "".join(
+            self.format_command(now, command) for command in commands
+        ).encode("utf-8")
+        self.written = 0
+
+        # If the connection was closed in the meantime, the commands which
+        # were not written yet are written again once with a new connection
+        for attempt in range(2):
+            try:
+                if self.connected and (
+                    time.monotonic() - self.last_write > self.idle_timeout
+                    or self.is_closed()
+                ):
+                    self.disconnect()
+
+                if not self.connected:
+                    await asyncio.wait_for(self.connect(), self.timeout)
+                    self.connected = True
+
+                await asyncio.wait_for(self.write(data[self.written :]), self.timeout)
+                self.last_write = time.monotonic()
+                break
+            except (OSError, asyncio.TimeoutError):
+                self.disconnect()
+                if attempt == 1:
+                    raise
+
+        if self.logger is not None:
+            self.logger.debug("%d commands were sent to the core", len(commands))
+
+    def disconnect(self):
+        if self.connected:
+            self.close()
+        self.connected = False
+
+    @abc.abstractmethod
+    def format_command(self, now, command):
+        pass
+
+    @abc.abstractmethod
+    async def connect(self):
+        pass
+
+    def is_closed(self):
+        return False
+
+    # Method to write the data to the connection. The number of bytes which
+    # were written for sure must be added to self.written.
+    @abc.abstractmethod
+    async def write(self, data):
+        pass
+
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+
+class LivestatusCommandWriter(CommandWriter):
+    def __init__(self, client, **kwargs) -> None:
+        super().__init__(**kwargs)
+        # The LivestatusClient of the site, which is used to open the
+        # connection. Livestatus keeps the connection open after commands.
+        self.client = client
+        self.reader = None
+        self.writer = None
+
+    def format_command(self, now, command):
+        return f"COMMAND [{now}] {command}\n\n"
+
+    async def connect(self):
+        self.reader, self.writer = await self.client.open_connection()
+
+    def is_closed(self):
+        # Livestatus does not answer commands, so the only data that can
+        # arrive is the end of the connection
+        return self.reader.at_eof() or self.writer.is_closing()
+
+    async def write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+        # If the connection was closed by the core, this is only noticed by
+        # the next write, so the whole batch is written again in this case
+        self.written += len(data)
+
+    def close(self):
+        self.writer.close()
+
+
+class PipeCommandWriter(CommandWriter):
+    def __init__(self, path, **kwargs) -> None:
+        super().__init__(**kwargs)
+        # Path of the command pipe of the core, e.g. tmp/run/nagios.cmd
+        self.path = path
+        self.fd = None
+
+    def format_command(self, now, command):
+        return f"[{now}] {command}\n"
+
+    async def connect(self):
+        # Opening the pipe without O_NONBLOCK would block until the core reads
+        # from it. If the core is not running, this fails immediately. The
+        # pipe stays non-blocking, so that a write which is cancelled after
+        # the timeout does not keep waiting in a thread.
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+
+    async def write(self, data):
+        loop = asyncio.get_running_loop()
+        view = memoryview(data)
+
+        while view:
+            try:
+                written = os.write(self.fd, view)
+            except BlockingIOError:
+                # The pipe is full, so wait until the core has read from it
+                writable = loop.create_future()
+                loop.add_writer(
+                    self.fd, lambda: writable.done() or writable.set_result(None)
+                )
+                try:
+                    await writable
+                finally:
+                    loop.remove_writer(self.fd)
+                continue
+
+            # Every written byte is counted, so that a batch which was only
+            # written partly is continued instead of being written again
+            view = view[written:]
+            self.written += written
+
+    def close(self):
+        os.close(self.fd)
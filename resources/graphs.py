@@ -0,0 +1,306 @@
+import asyncio
+import base64
+import io
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import httpx
+
+# Pillow is part of the python of the Check_MK sites. Without it the graphs are
+# sent as they are.
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class GraphError(Exception):
+    pass
+
+
+# Telegram shows photos with at most 1280 pixels on the longest side, larger
+# images are scaled down by Telegram anyway
+max_graph_width = 1280
+
+
+# Method to make a graph as small as possible for the upload. The graph is
+# scaled down to the width shown by Telegram and encoded as palette PNG and as
+# JPEG, and the smallest of them (or the original) is returned. This uses the
+# CPU, so it should be executed in a worker thread.
+def compress_graph(graph, max_width=max_graph_width):
+    if Image is None:
+        return graph
+
+    try:
+        image = Image.open(io.BytesIO(graph))
+        image.load()
+    except OSError:
+        return graph
+
+    candidates = [graph]
+
+    if image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height), Image.LANCZOS)
+        # The original can not be used any longer, as it is too large
+        candidates = []
+
+    image = image.convert("RGB")
+
+    # The graphs mostly consist of a few flat colors, so a palette with 256
+    # colors is usually enough and much smaller than a full color PNG
+    output = io.BytesIO()
+    image.quantize(colors=256).save(output, format="PNG", optimize=True)
+    candidates.append(output.getvalue())
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=85, optimize=True)
+    candidates.append(output.getvalue())
+
+    return min(candidates, key=len)
+
+
+class GraphClient(object):
+    def __init__(self, base_url, timeout=30, max_connections=4) -> None:
+        # Base URL of the Check_MK web interface of the site, e.g.
+        # "http://localhost:80/mysite/check_mk"
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.client = None
+        # Average time in seconds until the web server starts to answer
+        self.latency = 0.0
+
+    def get_client(self):
+        # The client is created within the running event loop and then
+        # reused, so that the connections to the web server are kept open
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                follow_redirects=True,
+                verify=False,
+            )
+
+        return self.client
+
+    # Method to get the graphs of a service as PNG images. The answer of
+    # Check_MK is a JSON list of base64 encoded images, which is read as a
+    # stream, so every image can be decoded and used as soon as it is complete.
+    async def iter_graphs(self, hostname, service):
+        started = time.monotonic()
+
+        async with self.get_client().stream(
+            "GET",
+            f"{self.base_url}/ajax_graph_images.py",
+            params={"host": hostname, "service": service},
+        ) as response:
+            self.latency = 0.8 * self.latency + 0.2 * (time.monotonic() - started)
+            response.raise_for_status()
+
+            buffer = bytearray()
+            checked = False
+            async for chunk in response.aiter_bytes():
+                buffer += chunk
+
+                # The answer is a JSON list of images. Anything else, e.g. the
+                # HTML of the login page, must not be read as images.
+                if not checked and buffer.strip():
+                    if not buffer.lstrip().startswith(b"["):
+                        raise GraphError(
+                            "The web interface did not return graphs "
+                            f"({response.headers.get('content-type', 'unknown')})"
+                        )
+                    checked = True
+
+                # Base64 does not contain any quotes, so every pair of quotes
+                # encloses exactly one image
+                while True:
+                    start = buffer.find(b'"')
+                    if start == -1:
+                        buffer.clear()
+                        break
+
+                    end = buffer.find(b'"', start + 1)
+                    if end == -1:
+                        del buffer[:start]
+                        break
+
+                    graph = bytes(buffer[start + 1 : end]).replace(b"\\/", b"/")
+                    del buffer[: end + 1]
+
+                    try:
+                        graph = base64.b64decode(graph, validate=True)
+                    except ValueError:
+                        raise GraphError(
+                            "The web interface returned an invalid graph"
+                        )
+
+                    yield graph
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+class GraphCache(object):
+    def __init__(self, ttl=60, max_entries=20) -> None:
+        # The graphs are reused for ttl seconds, so all requests for the same
+        # service within this time get the same graphs
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    # Returns a dict with the PNG images ("graphs") and, once they were
+    # uploaded, the file IDs of Telegram ("file_ids"), or None
+    def get(self, hostname, service):
+        entry = self.entries.get((hostname, service))
+
+        if entry is None or time.time() > entry["expires"]:
+            return None
+
+        self.entries.move_to_end((hostname, service))
+        return entry
+
+    def put(self, hostname, service, graphs=None, file_ids=None, ttl=None):
+        now = time.time()
+
+        # Remove the graphs which are outdated
+        for key, entry in list(self.entries.items()):
+            if now > entry["expires"]:
+                del self.entries[key]
+
+        # After the upload, Telegram only needs the file IDs to send the
+        # graphs again, so the images themselves are not kept any longer
+        self.entries[(hostname, service)] = {
+            "graphs": None if file_ids is not None else graphs,
+            "file_ids": file_ids,
+            "expires": now + (self.ttl if ttl is None else ttl),
+        }
+        self.entries.move_to_end((hostname, service))
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    # Method to store the file IDs of graphs which were taken from the cache
+    # and uploaded. The graphs keep their age, as they were not rendered again.
+    def set_file_ids(self, hostname, service, file_ids):
+        entry = self.entries.get((hostname, service))
+
+        if entry is not None:
+            entry["graphs"] = None
+            entry["file_ids"] = file_ids
+
+    # Method to remove the graphs of a service, e.g. if they are outdated
+    def delete(self, hostname, service):
+        self.entries.pop((hostname, service), None)
+
+
+class GraphPrefetcher(object):
+    def __init__(
+        self,
+        fetch,
+        cache,
+        client=None,
+        concurrency=1,
+        max_queue=20,
+        max_latency=2.0,
+        max_backoff=60,
+        logger=None,
+    ) -> None:
+        # Coroutine function which gets the graphs of a service and stores
+        # them in the cache
+        self.fetch = fetch
+        self.cache = cache
+        # The client of the web interface whose latency is watched
+        self.client = client
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_latency = max_latency
+        self.max_backoff = max_backoff
+        self.logger = logger
+
+        # Number of graph requests of users which are currently running.
+        # The prefetching waits until they are finished.
+        self.interactive = 0
+        self.queue = None
+        self.queued = set()
+        self.workers = []
+
+    # Context manager for the graph requests of users, during which no
+    # graphs are prefetched
+    @contextmanager
+    def pause(self):
+        self.interactive += 1
+        try:
+            yield
+        finally:
+            self.interactive -= 1
+
+    def is_busy(self):
+        return self.interactive > 0 or (
+            self.client is not None and self.client.latency > self.max_latency
+        )
+
+    # Method to queue the graphs of a service for prefetching. If the queue is
+    # full, the service is skipped, as the prefetching is only an optimization.
+    def enqueue(self, hostname, service):
+        key = (hostname, service)
+        if key in self.queued or self.cache.get(hostname, service) is not None:
+            return False
+
+        # The queue and the workers are created within the running event loop
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self.workers = [
+                asyncio.create_task(self.work()) for _ in range(self.concurrency)
+            ]
+
+        try:
+            self.queue.put_nowait(key)
+        except asyncio.QueueFull:
+            return False
+
+        self.queued.add(key)
+        return True
+
+    async def work(self):
+        backoff = 1
+
+        while True:
+            hostname, service = await self.queue.get()
+
+            try:
+                # Wait as long as users are requesting graphs or the web
+                # server is slow, so that the prefetching does not compete
+                # with them
+                while self.is_busy():
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    # The latency is only measured with requests, so it slowly
+                    # recovers while waiting
+                    if self.client is not None and self.interactive == 0:
+                        self.client.latency *= 0.5
+                backoff = 1
+
+                if self.cache.get(hostname, service) is None:
+                    await self.fetch(hostname, service)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The graphs will be loaded again when a user requests them
+                if self.logger is not None:
+                    self.logger.warning(
+                        "The graphs of %s on %s could not be prefetched: %s",
+                        service,
+                        hostname,
+                        e,
+                    )
+            finally:
+                self.queued.discard((hostname, service))
+                self.queue.task_done()
@@ -0,0 +1,96 @@
+import logging
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+
+# A single entry of the log file of the bot. Tracebacks and other messages
+# with several lines are part of the message.
+LogEntry = namedtuple("LogEntry", ["time", "level", "function", "message"])
+
+# The beginning of an entry in the format of the log file of the bot:
+# "%(asctime)s:%(levelname)s:%(funcName)s:%(message)s"
+entry_pattern = re.compile(
+    r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),\d+:([A-Z]+):([^:]*):(.*)$"
+)
+
+
+# Method to read the lines of a file from the end to the beginning. Only the
+# blocks which are needed are read, so the last lines of a large file can be
+# read without reading the whole file.
+def read_lines_backwards(path, block_size=65536):
+    with open(path, "rb") as log_file:
+        log_file.seek(0, os.SEEK_END)
+        position = log_file.tell()
+        rest = b""
+
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+
+            log_file.seek(position)
+            lines = (log_file.read(size) + rest).split(b"\n")
+
+            # The first line may be incomplete, so it is kept until the
+            # previous block was read
+            rest = lines[0]
+            for line in reversed(lines[1:]):
+                yield line.decode("utf-8", errors="replace")
+
+        yield rest.decode("utf-8", errors="replace")
+
+
+# Method to read the entries of the log file and of its rotated backups
+# (log.1, log.2, ...), starting with the newest entry
+def read_entries_backwards(path, backup_count=0):
+    for index in range(backup_count + 1):
+        file_path = path if index == 0 else f"{path}.{index}"
+        if not os.path.exists(file_path):
+            break
+
+        continuation = []
+        for line in read_lines_backwards(file_path):
+            match = entry_pattern.match(line)
+
+            # Lines which are not the beginning of an entry belong to the
+            # entry before them
+            if match is None:
+                if line:
+                    continuation.append(line)
+                continue
+
+            yield LogEntry(
+                time=datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S"),
+                level=match.group(2),
+                function=match.group(3),
+                message="\n".join([match.group(4)] + continuation[::-1]),
+            )
+            continuation = []
+
+
+# Method to get the latest entries of the log file, newest first. Only entries
+# with at least the given level, which mention the given user and which were
+# written after the given time are returned.
+def tail_entries(
+    path, limit, backup_count=0, min_level=None, user=None, since=None
+):
+    min_level = logging.getLevelName(min_level) if min_level else logging.NOTSET
+    user = user.lower().lstrip("@") if user else None
+    entries = []
+
+    for entry in read_entries_backwards(path, backup_count):
+        # The entries are ordered by time, so all further entries are older
+        if since is not None and entry.time < since:
+            break
+
+        level = logging.getLevelName(entry.level)
+        if isinstance(level, int) and level < min_level:
+            continue
+        if user is not None and user not in entry.message.lower():
+            continue
+
+        entries.append(entry)
+        if len(entries) >= limit:
+            break
+
+    return entries
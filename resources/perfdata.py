@@ -0,0 +1,134 @@
+import re
+from collections import OrderedDict, namedtuple
+
+# A single metric of the performance data of a service. The value, min and max
+# are numbers (or None if they are missing or unknown), warn and crit are kept
+# as text, because they can be ranges like "10:20" or "@~:5".
+Metric = namedtuple(
+    "Metric", ["label", "value", "unit", "warn", "crit", "min", "max"]
+)
+
+# A number, optionally followed by the unit of measurement (e.g. "12.5MB")
+value_pattern = re.compile(
+    r"^([-+]?(?:\d+(?:[.,]\d*)?|[.,]\d+)(?:[eE][-+]?\d+)?)(.*)$"
+)
+
+
+def parse_number(text):
+    match = value_pattern.match(text.strip())
+    if match is None:
+        return None, ""
+
+    return float(match.group(1).replace(",", ".")), match.group(2)
+
+
+# Method to format a number without losing digits, e.g. 123456789.0 ->
+# "123456789" and 0.25 -> "0.25"
+def format_number(value):
+    if value.is_integer() and abs(value) < 1e16:
+        return str(int(value))
+
+    return repr(value)
+
+
+def parse_label(perf_data, position):
+    # Labels with spaces or equal signs are enclosed in single quotes. A
+    # single quote within the label is written as two single quotes.
+    if perf_data[position] == "'":
+        label = ""
+        position += 1
+
+        while position < len(perf_data):
+            if perf_data[position] == "'":
+                if perf_data[position + 1 : position + 2] == "'":
+                    label += "'"
+                    position += 2
+                    continue
+
+                return label, position + 1
+
+            label += perf_data[position]
+            position += 1
+
+        return label, position
+
+    end = perf_data.find("=", position)
+    if end == -1 or " " in perf_data[position:end]:
+        end = perf_data.find(" ", position)
+        end = len(perf_data) if end == -1 else end
+
+    return perf_data[position:end], end
+
+
+def parse_values(label, text):
+    fields = (text.split(";") + [""] * 5)[:5]
+    value, unit = parse_number(fields[0])
+
+    # "U" means that the value could not be determined by the plugin
+    if not label or (value is None and fields[0].strip() != "U"):
+        return None
+
+    return Metric(
+        label=label,
+        value=value,
+        unit=unit,
+        warn=fields[1] or None,
+        crit=fields[2] or None,
+        min=parse_number(fields[3])[0],
+        max=parse_number(fields[4])[0],
+    )
+
+
+# Method to parse the performance data of a service in the format of the
+# Nagios plugin guidelines: 'label'=value[UOM];[warn];[crit];[min];[max]
+# Invalid metrics are skipped instead of failing for the whole service.
+def parse_perf_data(perf_data):
+    metrics = []
+    position = 0
+
+    while position < len(perf_data):
+        if perf_data[position].isspace():
+            position += 1
+            continue
+
+        label, position = parse_label(perf_data, position)
+
+        if perf_data[position : position + 1] != "=":
+            # Skip everything up to the next metric
+            end = perf_data.find(" ", position)
+            position = len(perf_data) if end == -1 else end
+            continue
+
+        end = perf_data.find(" ", position)
+        end = len(perf_data) if end == -1 else end
+
+        metric = parse_values(label, perf_data[position + 1 : end])
+        if metric is not None:
+            metrics.append(metric)
+
+        position = end
+
+    return metrics
+
+
+class PerfDataCache(object):
+    def __init__(self, max_size=1024) -> None:
+        self.max_size = max_size
+        self.metrics = OrderedDict()
+
+    # The performance data of a service only changes with a new check, so the
+    # parsed metrics are reused as long as the last check is the same
+    def get_metrics(self, hostname, service, last_check, perf_data):
+        key = (hostname, service, last_check)
+
+        if key in self.metrics:
+            self.metrics.move_to_end(key)
+            return self.metrics[key]
+
+        metrics = parse_perf_data(perf_data)
+        self.metrics[key] = metrics
+
+        if len(self.metrics) > self.max_size:
+            self.metrics.popitem(last=False)
+
+        return metrics
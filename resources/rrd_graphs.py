@@ -0,0 +1,261 @@
+import glob
+import io
+import math
+import os
+import subprocess
+import time
+from datetime import datetime
+
+# The python bindings of rrdtool and Pillow are part of the python of the
+# Check_MK sites. If one of them is missing, the command line tool of rrdtool
+# is used or the graphs can not be rendered locally.
+try:
+    import rrdtool
+except ImportError:
+    rrdtool = None
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+
+# Method to convert a host or service name to the name used for the RRD files
+# (the same replacements as pnp_cleanup of Check_MK)
+def pnp_cleanup(name):
+    for character in (" ", ":", "/", "\\"):
+        name = name.replace(character, "_")
+
+    return name
+
+
+# Method to format a value for the axis of a graph, e.g. 12345 -> "12.3k"
+def format_value(value):
+    for factor, suffix in ((1e12, "T"), (1e9, "G"), (1e6, "M"), (1e3, "k")):
+        if abs(value) >= factor:
+            return f"{value / factor:.3g}{suffix}"
+
+    return f"{value:.3g}"
+
+
+class RRDRenderer(object):
+    def __init__(
+        self, site_dir, time_range=4 * 3600, width=640, height=220, max_graphs=30
+    ) -> None:
+        self.site_dir = site_dir
+        self.time_range = time_range
+        self.width = width
+        self.height = height
+        self.max_graphs = max_graphs
+
+    def is_available(self):
+        return Image is not None
+
+    # Method to find the RRD files of a service. Returns a list of
+    # (metric name, path of the RRD file, name of the data source).
+    def find_sources(self, hostname, service):
+        host_dir = pnp_cleanup(hostname)
+        service_file = pnp_cleanup(service)
+
+        # Check_MK Micro Core: one RRD file per service, the names of the
+        # metrics are listed in the .info file next to it
+        cmc_path = os.path.join(
+            self.site_dir, "var", "check_mk", "rrd", host_dir, f"{service_file}.rrd"
+        )
+        info_path = cmc_path[:-4] + ".info"
+
+        if os.path.exists(cmc_path) and os.path.exists(info_path):
+            with open(info_path, encoding="utf-8") as info_file:
+                for line in info_file:
+                    if line.startswith("METRICS "):
+                        return [
+                            (metric, cmc_path, str(index + 1))
+                            for index, metric in enumerate(line[8:].strip().split(";"))
+                        ]
+
+        # Nagios core: one RRD file per metric in the PNP4Nagios format
+        pnp_dir = os.path.join(self.site_dir, "var", "pnp4nagios", "perfdata", host_dir)
+        prefix = os.path.join(pnp_dir, f"{service_file}_")
+
+        return [
+            (path[len(prefix) : -4], path, "1")
+            for path in sorted(glob.glob(f"{glob.escape(prefix)}*.rrd"))
+        ]
+
+    # Method to read the values of the time range from an RRD file. Only the
+    # needed range is read, with a resolution that fits the width of the
+    # graph, so that rrdtool can use the matching consolidated archive.
+    def fetch(self, path):
+        resolution = max(60, self.time_range // self.width)
+        end = int(time.time()) // resolution * resolution
+        arguments = [
+            path,
+            "AVERAGE",
+            "-s",
+            str(end - self.time_range),
+            "-e",
+            str(end),
+            "-r",
+            str(resolution),
+        ]
+
+        if rrdtool is not None:
+            (start, end, step), names, rows = rrdtool.fetch(*arguments)
+            return start, step, list(names), rows
+
+        # Without the python bindings the output of the command line tool is
+        # parsed, e.g. "1700000000: 1.0000000000e+00 -nan"
+        output = subprocess.run(
+            [os.path.join(self.site_dir, "bin", "rrdtool"), "fetch", *arguments],
+            stdout=subprocess.PIPE,
+            timeout=10,
+            check=True,
+        ).stdout.decode("utf-8")
+
+        lines = [line for line in output.split("\n") if line.strip()]
+        names = lines[0].split()
+        timestamps = []
+        rows = []
+
+        for line in lines[1:]:
+            timestamp, values = line.split(":", 1)
+            timestamps.append(int(timestamp))
+            rows.append(
+                tuple(
+                    None if "nan" in value.lower() else float(value)
+                    for value in values.split()
+                )
+            )
+
+        step = timestamps[1] - timestamps[0] if len(timestamps) > 1 else resolution
+        start = timestamps[0] - step if timestamps else end - self.time_range
+
+        return start, step, names, rows
+
+    # Method to reduce the values to one (minimum, maximum, average) per
+    # column of pixels, so that short peaks are still visible in the graph
+    def downsample(self, values, columns):
+        result = []
+
+        for column in range(columns):
+            first = column * len(values) // columns
+            last = (column + 1) * len(values) // columns
+            bucket = [
+                value
+                for value in values[first:last]
+                if value is not None and not math.isnan(value)
+            ]
+
+            result.append(
+                (min(bucket), max(bucket), sum(bucket) / len(bucket))
+                if bucket
+                else None
+            )
+
+        return result
+
+    def render_graph(self, title, start, step, values):
+        left, right, top, bottom = 52, 10, 24, 20
+        plot_width = self.width - left - right
+        plot_height = self.height - top - bottom
+
+        columns = self.downsample(values, min(plot_width, len(values)))
+        known = [column for column in columns if column is not None]
+
+        low = min([0] + [column[0] for column in known])
+        high = max([0] + [column[1] for column in known])
+        if high == low:
+            high = low + 1
+
+        image = Image.new("RGB", (self.width, self.height), "white")
+        draw = ImageDraw.Draw(image)
+        font = ImageFont.load_default()
+
+        def get_y(value):
+            return top + plot_height - (value - low) / (high - low) * plot_height
+
+        draw.text((left, 6), title, fill="black", font=font)
+
+        # Horizontal grid lines with the values on the left side
+        for line in range(5):
+            value = low + (high - low) * line / 4
+            y = get_y(value)
+            draw.line((left, y, left + plot_width, y), fill="#e0e0e0")
+            draw.text((4, y - 6), format_value(value), fill="#606060", font=font)
+
+        # The range between minimum and maximum is drawn as an area and the
+        # average as a line on top of it
+        points = []
+        for index, column in enumerate(columns):
+            x = left + index * plot_width / max(1, len(columns) - 1)
+
+            if column is None:
+                if len(points) > 1:
+                    draw.line(points, fill="#1e6fb4", width=2)
+                points = []
+                continue
+
+            draw.line((x, get_y(column[0]), x, get_y(column[1])), fill="#a8cdef")
+            points.append((x, get_y(column[2])))
+
+        if len(points) > 1:
+            draw.line(points, fill="#1e6fb4", width=2)
+
+        draw.rectangle(
+            (left, top, left + plot_width, top + plot_height), outline="#808080"
+        )
+
+        # Start and end of the time range below the graph
+        end = start + step * len(values)
+        draw.text(
+            (left, self.height - 16),
+            datetime.fromtimestamp(start).strftime("%d.%m. %H:%M"),
+            fill="#606060",
+            font=font,
+        )
+        draw.text(
+            (left + plot_width - 70, self.height - 16),
+            datetime.fromtimestamp(end).strftime("%d.%m. %H:%M"),
+            fill="#606060",
+            font=font,
+        )
+
+        output = io.BytesIO()
+        image.save(output, format="PNG", optimize=True)
+        return output.getvalue()
+
+    # Method to render the graphs of a service from its RRD files. Returns a
+    # list of PNG images (one per metric), which is empty if there are no RRD
+    # files. This reads files and uses the CPU, so it should be executed in a
+    # worker thread.
+    def render(self, hostname, service):
+        if not self.is_available():
+            return []
+
+        graphs = []
+        fetched = {}
+
+        for metric, path, source in self.find_sources(hostname, service):
+            if len(graphs) >= self.max_graphs:
+                break
+
+            # The RRD file of the Micro Core contains all metrics of the
+            # service, so it is only read once
+            if path not in fetched:
+                fetched[path] = self.fetch(path)
+
+            start, step, names, rows = fetched[path]
+            if source not in names:
+                continue
+
+            index = names.index(source)
+            graphs.append(
+                self.render_graph(
+                    f"{service} - {metric}",
+                    start,
+                    step,
+                    [row[index] for row in rows],
+                )
+            )
+
+        return graphs
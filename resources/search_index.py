@@ -0,0 +1,108 @@
+import heapq
+import re
+
+
+class SearchIndex(object):
+    def __init__(self) -> None:
+        # id -> (host name, service description or None for the host itself)
+        self.entries = []
+        self.ids = {}
+        # trigram -> set of ids, used for search terms with 3 or more
+        # characters
+        self.trigrams = {}
+        # prefix of a word -> set of ids, used for shorter search terms
+        self.prefixes = {}
+
+    def get_text(self, host_name, description):
+        if description is None:
+            return host_name.lower()
+
+        return f"{host_name} {description}".lower()
+
+    def add(self, host_name, description=None):
+        entry = (host_name, description)
+        if entry in self.ids:
+            return
+
+        entry_id = len(self.entries)
+        self.entries.append(entry)
+        self.ids[entry] = entry_id
+
+        text = self.get_text(host_name, description)
+
+        for index in range(len(text) - 2):
+            self.trigrams.setdefault(text[index : index + 3], set()).add(entry_id)
+
+        for word in re.split(r"[\s/_.:-]+", text):
+            if not word:
+                continue
+
+            for length in (1, 2):
+                self.prefixes.setdefault(word[:length], set()).add(entry_id)
+
+    def get_posting_lists(self, term):
+        if len(term) < 3:
+            return [self.prefixes.get(term, set())]
+
+        return sorted(
+            (
+                self.trigrams.get(term[index : index + 3], set())
+                for index in range(len(term) - 2)
+            ),
+            key=len,
+        )
+
+    def search(self, query, limit=20):
+        terms = query.lower().split()
+        if not terms:
+            return []
+
+        # Only the term with the rarest trigram is looked up in the index,
+        # starting with its smallest posting list. All other terms are
+        # checked on the few remaining candidates.
+        posting_lists = min(
+            (self.get_posting_lists(term) for term in terms),
+            key=lambda lists: len(lists[0]),
+        )
+        candidates = set(posting_lists[0])
+        for ids in posting_lists[1:]:
+            if not candidates:
+                break
+            candidates &= ids
+
+        results = []
+        for entry_id in candidates:
+            host_name, description = self.entries[entry_id]
+            text = self.get_text(host_name, description)
+
+            # The index only tells that a term may be contained, so every
+            # candidate is checked for all terms
+            if all(term in text for term in terms):
+                # Hosts come first, then the entries where the terms are
+                # found at the beginning, then the shortest names
+                results.append(
+                    (
+                        description is not None,
+                        not text.startswith(terms[0]),
+                        len(text),
+                        text,
+                        (host_name, description),
+                    )
+                )
+
+        return [result[-1] for result in heapq.nsmallest(limit, results)]
+
+
+# Method to build a new index from the given hosts and their services
+# (host name -> iterable of service descriptions). It does not change any
+# existing index, so it can be run in a worker thread.
+def build_index(services_by_host):
+    index = SearchIndex()
+
+    for host_name, descriptions in services_by_host.items():
+        index.add(host_name)
+
+        for description in descriptions:
+            index.add(host_name, description)
+
+    return index
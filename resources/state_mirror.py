@@ -0,0 +1,159 @@
+import time
+
+from async_livestatus import Query
+
+
+class StateMirror(object):
+    def __init__(self, client, full_reload_interval=600) -> None:
+        self.client = client
+        self.full_reload_interval = full_reload_interval
+
+        # host name -> [state, groups]
+        self.hosts = {}
+        # host name -> {service description: state}
+        self.services = {}
+        # hostgroup name -> set of host names
+        self.hostgroups = {}
+        # host names and (host name, service description) pairs which are
+        # currently not OK
+        self.host_problems = set()
+        self.service_problems = set()
+
+        # Hosts and services which were added since the last full reload, as
+        # (host name, service description or None) pairs. The generation is
+        # increased with every full reload.
+        self.added = []
+        self.generation = 0
+
+        self.ready = False
+        self.error = None
+        self.last_sync = 0
+        self.last_full_reload = 0
+
+    async def refresh(self):
+        now = time.time()
+        full_reload = (
+            not self.ready or now - self.last_full_reload > self.full_reload_interval
+        )
+
+        # If the update fails, the last known states are kept, but the error
+        # is remembered so that the data can be marked as outdated
+        try:
+            if full_reload:
+                await self.load_all()
+                self.last_full_reload = now
+            else:
+                await self.load_changes(self.last_sync)
+        except Exception as e:
+            self.error = e
+            raise
+
+        self.error = None
+        self.last_sync = now
+        self.ready = True
+
+    async def load_all(self):
+        # The full load is the only query without a limit, as it has to
+        # return every object of the site
+        hosts = await self.client.query_table(
+            Query("hosts", limit=None).columns("name", "state", "groups")
+        )
+        services = await self.client.query_table(
+            Query("services", limit=None).columns("host_name", "description", "state")
+        )
+
+        # Everything is loaded into new structures first, so that the
+        # mirror can be used without interruption during the reload
+        mirror = StateMirror(self.client)
+        for name, state, groups in hosts:
+            mirror.update_host(name, state, groups)
+        for host_name, description, state in services:
+            mirror.update_service(host_name, description, state)
+
+        self.hosts = mirror.hosts
+        self.services = mirror.services
+        self.hostgroups = mirror.hostgroups
+        self.host_problems = mirror.host_problems
+        self.service_problems = mirror.service_problems
+        self.added = []
+        self.generation += 1
+
+    async def load_changes(self, since):
+        # Only load the objects which were checked or changed their state
+        # since the last sync. One second is added as a safety margin,
+        # because the timestamps of livestatus are whole seconds.
+        since = int(since) - 1
+
+        hosts = await self.client.query_table(
+            Query("hosts", limit=None)
+            .columns("name", "state", "groups")
+            .filter("last_check", ">=", since)
+            .filter("last_state_change", ">=", since)
+            .filter_or(2)
+        )
+        services = await self.client.query_table(
+            Query("services", limit=None)
+            .columns("host_name", "description", "state")
+            .filter("last_check", ">=", since)
+            .filter("last_state_change", ">=", since)
+            .filter_or(2)
+        )
+
+        for name, state, groups in hosts:
+            self.update_host(name, state, groups)
+        for host_name, description, state in services:
+            self.update_service(host_name, description, state)
+
+    def update_host(self, name, state, groups):
+        if name in self.hosts:
+            for group in self.hosts[name][1]:
+                if group not in groups:
+                    self.hostgroups[group].discard(name)
+        else:
+            self.added.append((name, None))
+
+        self.hosts[name] = [state, groups]
+        self.services.setdefault(name, {})
+
+        for group in groups:
+            self.hostgroups.setdefault(group, set()).add(name)
+
+        if state != 0:
+            self.host_problems.add(name)
+        else:
+            self.host_problems.discard(name)
+
+    def update_service(self, host_name, description, state):
+        services = self.services.setdefault(host_name, {})
+        if description not in services:
+            self.added.append((host_name, description))
+
+        services[description] = state
+
+        if state != 0:
+            self.service_problems.add((host_name, description))
+        else:
+            self.service_problems.discard((host_name, description))
+
+    def get_host_state(self, host_name):
+        host = self.hosts.get(host_name)
+        return None if host is None else host[0]
+
+    def get_services(self, host_name):
+        return list(self.services.get(host_name, {}).items())
+
+    def get_host_problems(self, hostgroup):
+        return [
+            [host_name, self.hosts[host_name][0]]
+            for host_name in self.hostgroups.get(hostgroup, ())
+            if host_name in self.host_problems
+        ]
+
+    def get_service_problems(self, hostgroup):
+        hosts = self.hostgroups.get(hostgroup, set())
+
+        return [
+            [host_name, description, self.services[host_name][description]]
+            for host_name, description in self.service_problems
+            if host_name in hosts
+        ]
@@ -1,22 +1,42 @@
-import base64
+import asyncio
 import configparser
+import contextvars
+import functools
 import html
 import logging
 import os
-import subprocess
+import signal
 import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import wait as wait_for_futures
+from datetime import datetime, timedelta
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
+import ai_cache
+import ai_scheduler
+import async_livestatus
+import audit_log
+import command_writer
 import fqueue
-import livestatus
+import graphs
+import httpx
+import log_reader
+import perfdata
 import requests
+import rrd_graphs
+import search_index
+import state_mirror
+from async_livestatus import Query
 from telegram import (
     BotCommand,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InlineQueryResultArticle,
     InputMediaPhoto,
+    InputTextMessageContent,
     KeyboardButton,
     ReplyKeyboardMarkup,
     Update,
@@ -27,9 +47,11 @@ from telegram.ext import (
     CommandHandler,
     ContextTypes,
     ConversationHandler,
+    InlineQueryHandler,
     MessageHandler,
     filters,
 )
+from telegram.error import BadRequest, TelegramError
 from translate import Translator
 
 # Read configuration file
@@ -46,11 +68,49 @@ formatter = logging.Formatter("%(asctime)s:%(levelname)s:%(funcName)s:%(message)
 log_file_path = os.path.join(
     "/", "omd", "sites", omd_site, "var", "log", "telegram-plus.log"
 )
-log_file_handler = logging.FileHandler(log_file_path, mode="a")
+# The log file is rotated once it reaches the maximum size, so that it does
+# not grow without limit. The given number of older files is kept.
+log_backup_count = config.getint("telegram_bot", "log_backup_count", fallback=3)
+log_file_handler = RotatingFileHandler(
+    log_file_path,
+    mode="a",
+    maxBytes=config.getint("telegram_bot", "log_max_bytes", fallback=5 * 1024 * 1024),
+    backupCount=log_backup_count,
+)
 log_file_handler.setLevel(logging.DEBUG)
 log_file_handler.setFormatter(formatter)
 logger.addHandler(log_file_handler)
 
+# Structured log of the commands of all users, which can be searched from the
+# admin settings. The events are written in batches in the background.
+audit_events = audit_log.AuditLog(
+    os.path.join(omd_site_dir, "var", "log", "telegram-plus-audit.db"),
+    retention_days=config.getint("telegram_bot", "audit_retention_days", fallback=90),
+)
+
+# The event of the handler which is currently running, so that the outcome
+# can be set from everywhere within the handler
+audit_context = contextvars.ContextVar("audit_context", default=None)
+
+
+# Method to set the outcome of the current event, e.g. "denied". Only the
+# first outcome other than "ok" is kept.
+def set_audit_outcome(outcome):
+    event = audit_context.get()
+    if event is not None and event["outcome"] == "ok":
+        event["outcome"] = outcome
+
+
+# Every error that is logged within a handler marks its event as failed, as the
+# handlers catch their exceptions, log them and reply with an error message
+class AuditOutcomeHandler(logging.Handler):
+    def emit(self, record):
+        set_audit_outcome("error")
+
+
+audit_outcome_handler = AuditOutcomeHandler(level=logging.ERROR)
+logger.addHandler(audit_outcome_handler)
+
 # Get Telegram Bot API token from configuration file
 telegram_bot_token = config["telegram_bot"]["api_token"]
 
@@ -78,8 +138,12 @@ home_menu = ReplyKeyboardMarkup(
             KeyboardButton(text="🔄 RESCHEDULE CHECK"),
         ],
         [
+            KeyboardButton(text="📊 DASHBOARD"),
             KeyboardButton(text="⚙️ ADMIN SETTINGS"),
         ],
+        [
+            KeyboardButton(text="🔁 RECHECK ALL PROBLEMS"),
+        ],
     ],
     resize_keyboard=False,
     one_time_keyboard=True,
@@ -89,8 +153,115 @@ home_menu = ReplyKeyboardMarkup(
 # Set path of LiveStatus socket
 livestatus_socket_path = f"unix:{omd_site_dir}/tmp/run/live"
 
-# Create LiveStatus connection
-livestatus_connection = livestatus.SingleSiteConnection(livestatus_socket_path)
+# Create LiveStatus connection. The client keeps a small pool of connections
+# open and talks to the socket without blocking the event loop of the bot.
+livestatus_connection = async_livestatus.LivestatusClient(
+    livestatus_socket_path,
+    pool_size=config.getint("check_mk", "livestatus_pool_size", fallback=4),
+    timeout=config.getfloat("check_mk", "livestatus_timeout", fallback=10),
+    logger=logger,
+    slow_query_threshold=config.getfloat(
+        "check_mk", "livestatus_slow_query", fallback=1
+    ),
+)
+
+# Livestatus connections of all sites. The local site is always included,
+# further sites of a distributed setup can be added in the [sites] section of
+# the config file (e.g. "berlin = tcp:10.0.0.2:6557").
+livestatus_sites = {omd_site: livestatus_connection}
+
+if config.has_section("sites"):
+    for site_name, site_socket_path in config.items("sites"):
+        livestatus_sites[site_name] = async_livestatus.LivestatusClient(
+            site_socket_path,
+            pool_size=config.getint("check_mk", "livestatus_pool_size", fallback=4),
+            timeout=config.getfloat("check_mk", "livestatus_site_timeout", fallback=5),
+            logger=logger,
+            slow_query_threshold=config.getfloat(
+                "check_mk", "livestatus_slow_query", fallback=1
+            ),
+        )
+
+# Sends the queries to all sites at the same time and merges the results
+livestatus_multisite = async_livestatus.MultiSiteClient(
+    livestatus_sites, logger=logger
+)
+
+# Cache for the queries of the menus. When many users open a menu at the same
+# time, the query is only sent once and the result is reused for a short time.
+livestatus_cache = async_livestatus.QueryCache(
+    livestatus_multisite,
+    ttls={"hostgroups": 60, "hostsbygroup": 30, "services": 10},
+)
+
+# In-memory copy of the states of all hosts and services of every site. It is
+# loaded once and then only updated with the objects that changed, so that the
+# status and problem views do not have to query livestatus every time.
+livestatus_mirrors = {
+    site_name: state_mirror.StateMirror(
+        client,
+        full_reload_interval=config.getint(
+            "check_mk", "state_mirror_full_reload", fallback=600
+        ),
+    )
+    for site_name, client in livestatus_sites.items()
+}
+
+# Every site gets one writer for the external commands of the bot
+# (acknowledgements, downtimes and rechecks). It keeps its connection open and
+# writes all commands which are submitted at the same time together. With
+# "pipe", the commands of the local site are written to the command pipe of
+# the core instead of livestatus.
+command_interface = config.get("check_mk", "command_interface", fallback="livestatus")
+command_writers = {
+    site_name: command_writer.LivestatusCommandWriter(client, logger=logger)
+    for site_name, client in livestatus_sites.items()
+}
+
+if command_interface == "pipe":
+    command_writers[omd_site] = command_writer.PipeCommandWriter(
+        os.path.join(omd_site_dir, "tmp", "run", "nagios.cmd"), logger=logger
+    )
+
+# Index over the names of all hosts and services for the search. It is
+# updated with the hosts and services that the state mirrors have added.
+host_search_index = search_index.SearchIndex()
+# site name -> (generation of the mirror, number of added objects) which are
+# already contained in the search index
+search_index_positions = {}
+
+# Parsed performance data of the services, reused as long as the service has
+# not been checked again
+perf_data_cache = perfdata.PerfDataCache()
+
+# Client for the graphs of the Check_MK web interface. The connections to the
+# local web server are kept open and reused.
+graph_client = graphs.GraphClient(
+    f"http://localhost:80/{omd_site}/check_mk",
+    timeout=config.getfloat("check_mk", "graph_timeout", fallback=30),
+)
+
+# The graphs are scaled down and compressed before the upload in worker
+# threads, so that the event loop of the bot is not blocked by the encoding
+graph_executor = ThreadPoolExecutor(
+    max_workers=config.getint("check_mk", "graph_workers", fallback=2),
+    thread_name_prefix="graphs",
+)
+
+# Cache for the graphs which were sent recently. When several users request
+# the same graphs within a short time, they are only rendered and uploaded once.
+graph_cache = graphs.GraphCache(
+    ttl=config.getint("check_mk", "graph_cache_ttl", fallback=60),
+)
+
+# The graphs can also be rendered by the bot itself from the RRD files of the
+# site ("rrd"), which avoids the round trip over the web interface. With "web"
+# the local rendering is only used if the web interface is not reachable.
+graph_renderer = config.get("check_mk", "graph_renderer", fallback="web")
+rrd_renderer = rrd_graphs.RRDRenderer(
+    omd_site_dir,
+    time_range=config.getint("check_mk", "graph_range", fallback=4 * 3600),
+)
 
 # Set path of query for notifications
 notify_query_folder = os.path.join(omd_site_dir, "tmp", "telegram_plus")
@@ -101,15 +272,33 @@ Path(notify_query_folder).mkdir(parents=True, exist_ok=True)
 notifcation_queue = fqueue.Queue(notify_query_path)
 
 gpt = None
+# Seconds after which a question to the AI is cancelled
+ai_timeout = config.getfloat("openai", "timeout", fallback=60)
 
 if config.has_section("openai"):
     try:
-        from openai import OpenAI
+        from openai import AsyncOpenAI
 
-        gpt = OpenAI(api_key=config["openai"]["token"])
+        gpt = AsyncOpenAI(api_key=config["openai"]["token"], timeout=ai_timeout)
     except Exception as e:
         logger.critical(e)
 
+# The answers of the AI to the problems of services are kept, so that the same
+# problem is only sent to the AI once, even if it occurs on several hosts
+ai_answers = ai_cache.AICache(
+    os.path.join(omd_site_dir, "var", "telegram-plus-ai-cache.db"),
+    config.getint("openai", "cache_ttl", fallback=30 * 24 * 3600),
+)
+
+# Only a few questions are sent to the AI at the same time. The users take
+# turns, identical questions are only sent once and further questions are
+# rejected if too many are waiting.
+ai_requests = ai_scheduler.AIScheduler(
+    config.getint("openai", "max_concurrent_requests", fallback=2),
+    config.getint("openai", "max_queued_requests", fallback=20),
+    config.getint("openai", "max_requests_per_user", fallback=3),
+)
+
 
 # Function to set bot commands
 async def post_init(bot_handler: Application) -> None:
@@ -121,6 +310,10 @@ async def post_init(bot_handler: Application) -> None:
             BotCommand("menu", "Update the menu"),
             BotCommand("cancel", "Cancel a conversation"),
             BotCommand("authenticate", "Verify yourself to the bot"),
+            BotCommand("dashboard", "Get a summary of all problems"),
+            BotCommand("find", "Search for hosts and services"),
+            BotCommand("logs", "Show the latest log entries, e.g. /logs warning 24h"),
+            BotCommand("audit", "Search the audit log, e.g. /audit acks @alice 7d"),
         ]
     )
 
@@ -215,6 +408,7 @@ def log_authenticated_access(username, command):
 
 
 def log_unauthenticated_access(username, command):
+    set_audit_outcome("denied")
     logger.warning(
         "%s tried to execute the command '%s' " "but was not authorised to do so!",
         username,
@@ -222,6 +416,60 @@ def log_unauthenticated_access(username, command):
     )
 
 
+# Method to get the target of a command for the audit log, which is the text
+# of the message or the data of the pressed button without its type
+def get_audit_target(update):
+    if update.callback_query is not None:
+        target = str(update.callback_query.data)
+        target = target.split(",", 1)[-1]
+    elif update.message is not None and update.message.text is not None:
+        target = update.message.text
+    elif update.inline_query is not None:
+        target = update.inline_query.query
+    else:
+        return None
+
+    return target[:200]
+
+
+# Decorator which records every call of a handler in the audit log, with the
+# user, the target, the duration and the outcome. The target is not recorded
+# for handlers that receive secrets, e.g. passwords.
+def audited(record_target=True):
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            event = {"outcome": "ok"}
+            token = audit_context.set(event)
+            started = time.monotonic()
+
+            try:
+                return await handler(update, context)
+            except BaseException:
+                event["outcome"] = "error"
+                raise
+            finally:
+                audit_context.reset(token)
+                user = update.effective_user
+                audit_events.record(
+                    user.id if user else None,
+                    user.username if user else None,
+                    handler.__name__,
+                    get_audit_target(update) if record_target else None,
+                    time.monotonic() - started,
+                    event["outcome"],
+                )
+
+        return wrapper
+
+    return decorator
+
+
+# Method to write the recorded events of the audit log to its database
+async def flush_audit_log(context: ContextTypes.DEFAULT_TYPE):
+    await asyncio.to_thread(audit_events.flush)
+
+
 # Method to check if a user is authenticated
 def is_user_authenticated(user_id):
     # Read the config file again so that no information is missing.
@@ -234,6 +482,13 @@ def is_user_authenticated(user_id):
         return False
 
 
+# Method to check if a user may use the admin settings. If no admin users are
+# configured, every authenticated user may use them.
+def is_user_admin(user_id):
+    admin_users = config["telegram_bot"].get("admin_users", "")
+    return str(user_id) in admin_users or not admin_users
+
+
 # Method to get the state "details"
 def get_state_details(val):
     if val == 0 or val == "OK" or val == "UP":
@@ -256,6 +511,62 @@ def update_config(section, key, value):
         config.write(configfile)
 
 
+# Translations that have already been looked up, keyed by (language, text)
+translation_cache = {}
+translation_cache_size = 5000
+
+# Translations that are currently being looked up in the background
+translations_pending = {}
+translations_lock = threading.Lock()
+
+# The translation service is contacted over HTTP, so the lookups are done in
+# worker threads and never on the event loop of the bot
+translation_executor = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="translate"
+)
+
+
+# Method to look up a translation and store it in the cache. This runs in the
+# translation worker threads.
+def fill_translation(output_language, text):
+    key = (output_language, text)
+
+    try:
+        translation = Translator(to_lang=output_language).translate(text)
+
+        with translations_lock:
+            translation_cache[key] = translation
+
+            # Drop the oldest entries if the cache grows too big
+            while len(translation_cache) > translation_cache_size:
+                translation_cache.pop(next(iter(translation_cache)))
+
+        return translation
+    finally:
+        with translations_lock:
+            translations_pending.pop(key, None)
+
+
+# Method to queue a translation in the background. If the same text is
+# already being translated, the running lookup is reused.
+def queue_translation(output_language, text):
+    key = (output_language, text)
+
+    with translations_lock:
+        if key not in translations_pending:
+            translations_pending[key] = translation_executor.submit(
+                fill_translation, output_language, text
+            )
+
+        return translations_pending[key]
+
+
+# Method to get the maximum time (in seconds) a translation may take before
+# the original text is used instead
+def get_translation_timeout():
+    return config.getfloat("telegram_bot", "translation_timeout", fallback=0.005)
+
+
 # Method to shorten the code and make translation easier
 def translate(text):
     config.read("config.ini")
@@ -266,14 +577,74 @@ def translate(text):
         update_config("telegram_bot", "language", "en")
 
     output_language = config["telegram_bot"]["language"]
-    translator = Translator(to_lang=output_language)
 
-    if not output_language == "en":
-        return translator.translate(text)
-    else:
+    if output_language == "en":
+        return text
+
+    translation = translation_cache.get((output_language, text))
+    if translation is not None:
+        return translation
+
+    # Wait only a very short time for the translation. If it takes longer,
+    # the English text is returned and the translation is stored in the
+    # cache as soon as it arrives, so that the next call can use it.
+    try:
+        return queue_translation(output_language, text).result(
+            timeout=get_translation_timeout()
+        )
+    except FutureTimeoutError:
+        return text
+    except Exception as e:
+        logger.warning("The translation failed: %s", e)
         return text
 
 
+# Method to translate many texts at once (e.g. the lines of a log or the
+# paragraphs of an AI answer). Identical texts are only translated once and
+# all missing translations are looked up in parallel.
+def translate_batch(texts, timeout=None):
+    config.read("config.ini")
+    output_language = config["telegram_bot"].get("language", "en")
+
+    if output_language == "en":
+        return list(texts)
+
+    translations = {}
+    pending = {}
+
+    for text in set(texts):
+        # Empty lines or lines without letters do not need a translation
+        if not any(character.isalpha() for character in text):
+            translations[text] = text
+        elif (output_language, text) in translation_cache:
+            translations[text] = translation_cache[(output_language, text)]
+        else:
+            pending[queue_translation(output_language, text)] = text
+
+    # All lookups share the same deadline. Whatever is not finished by then
+    # stays in English and is added to the cache in the background.
+    if pending:
+        done, not_done = wait_for_futures(
+            pending,
+            timeout=get_translation_timeout() if timeout is None else timeout,
+        )
+
+        for future in done:
+            try:
+                translations[pending[future]] = future.result()
+            except Exception as e:
+                logger.warning("The translation failed: %s", e)
+
+    return [translations.get(text, text) for text in texts]
+
+
+# Method to translate a multi-line text line by line, so that every line can
+# be cached and reused on its own. Outside of the event loop a longer timeout
+# can be used, e.g. for new texts which are never in the cache.
+def translate_lines(text, timeout=None):
+    return "\n".join(translate_batch(text.split("\n"), timeout))
+
+
 def get_bot_version_details():
     details = requests.get(
         "https://api.github.com/repos/deexno/checkmk-telegram-plus/releases/latest"
@@ -310,6 +681,7 @@ def get_bot_version_details():
 
 
 # Method to initially start the conversation with the bot
+@audited()
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Get the userdetails
     user = update.effective_user
@@ -340,6 +712,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 # Method to show help
+@audited()
 async def help_command(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -367,24 +740,24 @@ async def help_command(
 
 
 # Method to get the host name
+@audited()
 async def get_host_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Initialize hosts list
     hosts = []
 
     # Try to get the data from the livestatus connection & sort them
     try:
-        for host in sorted(
-            livestatus_connection.query_table(
-                "GET hostsbygroup\n"
-                f"Filter: hostgroup_name = {update.message.text}\n"
-                "Columns: name"
-            ),
-            key=lambda d: d[0],
-        ):
+        rows, unreachable_sites = await livestatus_cache.query_table_with_errors(
+            Query("hostsbygroup", limit=None)
+            .columns("name")
+            .filter("hostgroup_name", "=", update.message.text)
+        )
+        for host in sorted(rows, key=lambda d: d[0]):
             hosts.append(KeyboardButton(text=str(host[0])))
 
-        await update.message.reply_text(
-            translate("PLEASE TELL ME THE HOSTNAME"),
+        await update.message.reply_html(
+            translate("PLEASE TELL ME THE HOSTNAME")
+            + get_unreachable_sites_note(unreachable_sites),
             reply_markup=ReplyKeyboardMarkup.from_column(
                 hosts,
                 resize_keyboard=False,
@@ -407,6 +780,7 @@ async def get_host_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
 
 # Method to get the host group name
+@audited()
 async def get_host_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Check if the user is authenticated
     if is_user_authenticated(update.effective_user.id):
@@ -414,21 +788,21 @@ async def get_host_group(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
         try:
             # Get the list of hostgroups from livestatus connection
-            # and sort them
-            for hostgroup in sorted(
-                livestatus_connection.query_table(
-                    "GET hostgroups\nColumns: name\n",
-                ),
-                key=lambda d: d[0],
-            ):
+            # and sort them. The same hostgroup can exist on several sites,
+            # so every name is only listed once.
+            rows, unreachable_sites = await livestatus_cache.query_table_with_errors(
+                Query("hostgroups", limit=None).columns("name"),
+            )
+            for hostgroup in sorted({row[0] for row in rows}):
                 # Append each hostgroup to the hostgroups list
-                hostgroups.append(KeyboardButton(text=str(hostgroup[0])))
+                hostgroups.append(KeyboardButton(text=str(hostgroup)))
 
             # Reply to the message with the list of hostgroups in the form
             # a ReplyKeyboardMarkup and prompt the user to select one
             # of these
-            await update.message.reply_text(
-                translate("PLEASE TELL ME THE HOSTGROUP OF THE HOST"),
+            await update.message.reply_html(
+                translate("PLEASE TELL ME THE HOSTGROUP OF THE HOST")
+                + get_unreachable_sites_note(unreachable_sites),
                 reply_markup=ReplyKeyboardMarkup.from_column(
                     hostgroups,
                     resize_keyboard=False,
@@ -461,6 +835,7 @@ async def get_host_group(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 # Method to get the service name
+@audited()
 async def get_service_name(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -470,22 +845,21 @@ async def get_service_name(
     try:
         # Get list of services from livestatus connection and sort
         # by description
-        for description, state in sorted(
-            livestatus_connection.query_table(
-                "GET services\n"
-                f"Filter: host_name = {update.message.text}\n"
-                "Columns: description state\n"
-            ),
-            key=lambda d: d[0],
-        ):
+        rows, unreachable_sites = await livestatus_cache.query_table_with_errors(
+            Query("services", limit=None)
+            .columns("description", "state")
+            .filter("host_name", "=", update.message.text)
+        )
+        for description, state in sorted(rows, key=lambda d: d[0]):
             # Append the service to services list
             services.append(f"{update.message.text} / {description}")
 
         # Reply to the message with the list of services in the form
         # a ReplyKeyboardMarkup and prompt the user to select one
         # of these
-        await update.message.reply_text(
-            translate("PLEASE TELL ME THE SERVICE NAME"),
+        await update.message.reply_html(
+            translate("PLEASE TELL ME THE SERVICE NAME")
+            + get_unreachable_sites_note(unreachable_sites),
             reply_markup=ReplyKeyboardMarkup.from_column(
                 services,
                 resize_keyboard=False,
@@ -510,24 +884,182 @@ async def get_service_name(
     return SERVICE
 
 
-def get_host_status(hostname):
-    # Get the status of a host
-    host = livestatus_connection.query_table(
-        f"GET hosts\nFilter: name = {hostname}\nColumns: state"
+# Method to keep the state mirrors up to date. It is executed regularly by the
+# job queue of the bot. The sites are updated in parallel, so a site which does
+# not respond does not delay the others.
+async def refresh_livestatus_mirror(context: ContextTypes.DEFAULT_TYPE):
+    results = await asyncio.gather(
+        *[mirror.refresh() for mirror in livestatus_mirrors.values()],
+        return_exceptions=True,
+    )
+
+    for site_name, result in zip(livestatus_mirrors, results):
+        if isinstance(result, Exception):
+            logger.critical("The site %s could not be updated: %s", site_name, result)
+
+    try:
+        await update_search_index()
+    except Exception as e:
+        logger.critical(e)
+
+
+# Method to bring the search index up to date with the state mirrors. After a
+# full reload of a mirror the index is built again in a worker thread,
+# otherwise only the newly added hosts and services are indexed.
+async def update_search_index():
+    global host_search_index
+
+    rebuild = any(
+        search_index_positions.get(site_name, (None, 0))[0] != mirror.generation
+        for site_name, mirror in livestatus_mirrors.items()
+        if mirror.ready
+    )
+
+    if rebuild:
+        services_by_host = {}
+        for site_name, mirror in livestatus_mirrors.items():
+            # A host may be monitored by several sites, so the services of
+            # all sites are kept
+            for host_name, services in mirror.services.items():
+                services_by_host.setdefault(host_name, []).extend(services)
+
+            search_index_positions[site_name] = (mirror.generation, len(mirror.added))
+
+        host_search_index = await asyncio.to_thread(
+            search_index.build_index, services_by_host
+        )
+        return
+
+    for site_name, mirror in livestatus_mirrors.items():
+        generation, position = search_index_positions.get(site_name, (None, 0))
+
+        for host_name, description in mirror.added[position:]:
+            host_search_index.add(host_name, description)
+
+        search_index_positions[site_name] = (generation, len(mirror.added))
+
+
+# Method to get a note about the sites which could not be reached
+def get_unreachable_sites_note(unreachable_sites):
+    if not unreachable_sites:
+        return ""
+
+    return (
+        f"\n⚠️ <b>{translate('SITES NOT REACHABLE')}:</b> "
+        f"{', '.join(sorted(unreachable_sites))}\n"
+    )
+
+
+# Method to collect rows from the state mirrors of all sites. Sites whose
+# mirror is not loaded yet (e.g. right after the start of the bot) are asked
+# directly via livestatus. Returns the rows and the sites that could not be
+# reached.
+async def collect_from_sites(get_rows, query):
+    rows = []
+    unreachable_sites = []
+    missing_sites = []
+
+    for site_name, mirror in livestatus_mirrors.items():
+        if not mirror.ready:
+            missing_sites.append(site_name)
+            continue
+
+        rows.extend(get_rows(mirror))
+
+        if mirror.error is not None:
+            unreachable_sites.append(site_name)
+
+    if missing_sites:
+        site_rows, errors = await livestatus_multisite.query_sites(
+            query, sites=missing_sites
+        )
+
+        for site_name in site_rows:
+            rows.extend(site_rows[site_name])
+
+        unreachable_sites.extend(errors)
+
+    return rows, unreachable_sites
+
+
+# Method to find the state mirror which knows the host
+def find_mirror(hostname):
+    for mirror in livestatus_mirrors.values():
+        if mirror.ready and hostname in mirror.hosts:
+            return mirror
+
+    return None
+
+
+# Returns the state of the host and the sites that could not be reached
+async def query_host_state(hostname):
+    mirror = find_mirror(hostname)
+    if mirror is not None:
+        return mirror.get_host_state(hostname), []
+
+    host, unreachable_sites = await livestatus_multisite.query_table_with_errors(
+        Query("hosts", limit=1).columns("state").filter("name", "=", hostname)
+    )
+    return host[0][0], unreachable_sites
+
+
+# Returns the services of the host and the sites that could not be reached
+async def query_services(hostname):
+    mirror = find_mirror(hostname)
+    if mirror is not None:
+        return mirror.get_services(hostname), []
+
+    return await livestatus_multisite.query_table_with_errors(
+        Query("services", limit=None)
+        .columns("description", "state")
+        .filter("host_name", "=", hostname)
+    )
+
+
+async def query_host_problems(hostgroup):
+    return await collect_from_sites(
+        lambda mirror: mirror.get_host_problems(hostgroup),
+        Query("hostsbygroup", limit=None)
+        .filter("state", "=", 1)  # filter for hosts with a state of warn
+        .filter("state", "=", 2)  # filter for hosts with a state of crit
+        .filter("state", "=", 3)  # filter for hosts with a state of unkn
+        .filter_or(3)  # combine the three filters above with a logical OR
+        .filter("hostgroup_name", "=", hostgroup)
+        .columns("name", "state"),  # only return the host name and state
+    )
+
+
+async def query_service_problems(hostgroup):
+    return await collect_from_sites(
+        lambda mirror: mirror.get_service_problems(hostgroup),
+        Query("servicesbyhostgroup", limit=None)
+        .filter("state", "=", 1)
+        .filter("state", "=", 2)
+        .filter("state", "=", 3)
+        .filter_or(3)
+        .filter("hostgroup_name", "=", hostgroup)
+        .columns("host_name", "description", "state"),
     )
+
+
+async def get_host_status(hostname):
+    # Get the status of a host
+    host_state, unreachable_sites = await query_host_state(hostname)
     state = f"{hostname} IS "
-    state += "ONLINE ✅" if host[0][0] == 0 else "<u><b>OFFLINE</b></u> 🛑"
+    state += "ONLINE ✅" if host_state == 0 else "<u><b>OFFLINE</b></u> 🛑"
+    state += get_unreachable_sites_note(unreachable_sites)
 
     return state
 
 
+@audited()
 async def print_host_status(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
 ) -> None:
     try:
         # Reply to the user with the current status of the host
-        state = get_host_status(update.message.text)
+        state = await get_host_status(update.message.text)
         await update.message.reply_html(
             translate(state),
             reply_markup=home_menu,
@@ -543,32 +1075,106 @@ async def print_host_status(
     return ConversationHandler.END
 
 
+# Number of rows which are shown on one page of a result view. Telegram does
+# not accept messages with more than 4096 characters, so long results are
+# split into pages.
+result_page_size = 25
+
+# Number of result views which are kept per user so that they can be paged
+result_views_per_user = 5
+
+
+# Method to get the text and the inline buttons of a page of a result view
+def get_result_page(view, view_id, page):
+    rows = view["rows"]
+    page_size = view.get("page_size", result_page_size)
+    pages = max(1, -(-len(rows) // page_size))
+    page = min(max(page, 0), pages - 1)
+
+    text = view["title"]
+    for row in rows[page * page_size : (page + 1) * page_size]:
+        text += view["format_row"](row)
+    text += view["footer"]
+
+    # Results with only one page do not need any buttons
+    if pages == 1:
+        return text, None
+
+    text += f"\n{translate('PAGE')} {page + 1}/{pages}"
+
+    buttons = []
+    if page > 0:
+        buttons.append(
+            InlineKeyboardButton(
+                "◀️ PREV",
+                callback_data=f"page,{view_id},{page - 1}",
+            )
+        )
+    if page < pages - 1:
+        buttons.append(
+            InlineKeyboardButton(
+                "NEXT ▶️",
+                callback_data=f"page,{view_id},{page + 1}",
+            )
+        )
+
+    return text, InlineKeyboardMarkup([buttons])
+
+
+# Method to send the first page of a result view. The rows are kept in the
+# user data, so that the other pages can be shown without querying them again.
+async def send_result_view(
+    update, context, title, rows, format_row, footer="", page_size=result_page_size
+):
+    views = context.user_data.setdefault("result_views", {})
+    view_id = context.user_data.get("next_result_view_id", 0)
+    context.user_data["next_result_view_id"] = view_id + 1
+
+    views[view_id] = {
+        "title": title,
+        "rows": rows,
+        "format_row": format_row,
+        "footer": footer,
+        "page_size": page_size,
+    }
+
+    # Only the latest views of every user are kept
+    while len(views) > result_views_per_user:
+        del views[min(views)]
+
+    text, reply_markup = get_result_page(views[view_id], view_id, 0)
+
+    await update.effective_message.reply_html(
+        text,
+        reply_markup=reply_markup or home_menu,
+    )
+
+
+@audited()
 async def get_services(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
 ) -> int:
-    services = f"<u><b>{update.message.text}:</b></u>\n\n"
-
     try:
         # Get list of services from livestatus connection and sort
         # by description
-        for description, state in sorted(
-            livestatus_connection.query_table(
-                "GET services\n"
-                f"Filter: host_name = {update.message.text}\n"
-                "Columns: description state\n"
-            ),
-            key=lambda d: d[0],
-        ):
-            state_emoji, state_text = get_state_details(state)
-            services += f"{state_emoji} {description} - {state_text}\n"
+        services, unreachable_sites = await query_services(update.message.text)
+        services.sort(key=lambda d: d[0])
 
-        # Reply to the message with the list of services in the form
-        # a ReplyKeyboardMarkup and prompt the user to select one
-        # of these
-        await update.message.reply_html(
+        def format_service(row):
+            description, state = row
+            state_emoji, state_text = get_state_details(state)
+            return f"{state_emoji} {description} - {state_text}\n"
+
+        # Reply to the message with the services, split into pages if the
+        # host has too many services for one message
+        await send_result_view(
+            update,
+            context,
+            f"<u><b>{update.message.text}:</b></u>\n\n",
             services,
-            reply_markup=home_menu,
+            format_service,
+            get_unreachable_sites_note(unreachable_sites),
         )
 
     except Exception as e:
@@ -584,19 +1190,21 @@ async def get_services(
     return ConversationHandler.END
 
 
-def get_service_details(hostname, servicename):
+async def get_service_details(hostname, servicename):
     # Get list of services from livestatus connection using filters and
     # specific columns
-    service = livestatus_connection.query_table(
-        "GET services\n"
-        f"Filter: host_name = {hostname}\n"
-        f"Filter: description = {servicename}\n"
-        "Columns: "
-        "description "
-        "state perf_data "
-        "plugin_output "
-        "long_plugin_output "
-        "last_check "
+    service, unreachable_sites = await livestatus_multisite.query_table_with_errors(
+        Query("services", limit=1)
+        .filter("host_name", "=", hostname)
+        .filter("description", "=", servicename)
+        .columns(
+            "description",
+            "state",
+            "perf_data",
+            "plugin_output",
+            "long_plugin_output",
+            "last_check",
+        )
     )
 
     # Get the state details for the service using the state value from the
@@ -616,13 +1224,27 @@ def get_service_details(hostname, servicename):
     )
 
     # Add any available metrics to the details string
-    if len(service[0][2]) > 1:
-        for metric in service[0][2].split(" "):
-            if "=" in metric:
-                name, values = metric.split("=")
-                value, warn, crit, min, max = values.split(";")
-                details += f"{name}: {value}\n"
-    else:
+    metrics = perf_data_cache.get_metrics(
+        hostname, servicename, service[0][5], service[0][2]
+    )
+
+    for metric in metrics:
+        value = (
+            "?"
+            if metric.value is None
+            else perfdata.format_number(metric.value) + metric.unit
+        )
+        details += f"{html.escape(metric.label)}: {html.escape(value)}"
+
+        if metric.warn or metric.crit:
+            details += (
+                f" ({html.escape(metric.warn or '-')}/"
+                f"{html.escape(metric.crit or '-')})"
+            )
+
+        details += "\n"
+
+    if not metrics:
         details += translate("No metrics available\n")
 
     # Add last check time to the details string
@@ -630,10 +1252,12 @@ def get_service_details(hostname, servicename):
         f"\n<b>{translate('INFO')}: </b>\n"
         f"{translate('Last Check')}: {datetime.fromtimestamp(service[0][5])}"
     )
+    details += get_unreachable_sites_note(unreachable_sites)
 
     return details
 
 
+@audited()
 async def print_service_details(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
@@ -642,7 +1266,7 @@ async def print_service_details(
 
     try:
         # Get the service details and reply with the details using HTML
-        details = get_service_details(hostname, service)
+        details = await get_service_details(hostname, service)
         await update.message.reply_html(
             details,
             reply_markup=home_menu,
@@ -662,41 +1286,228 @@ async def print_service_details(
     return ConversationHandler.END
 
 
-def get_service_graphs(hostname, service):
-    # Construct URL to request graphs of the specified service on the
-    # specified host
-    url = (
-        f"http://localhost:80/{omd_site}/check_mk/ajax_graph_images.py?"
-        f"host={hostname}&"
-        f"service={service}"
-    )
+# Split the graphs into groups of 10 or fewer, since Telegram's API has a
+# limit on the number of media items per message
+max_media_chunk_size = 10
+
+
+# Method to iterate over graphs which are already in memory
+async def iter_cached_graphs(graphs):
+    for graph in graphs:
+        yield graph
 
-    # Send a GET request to the constructed URL and retrieve the response
-    response = requests.get(url, allow_redirects=True, verify=False)
 
-    # Raise an exception if there was an HTTP error
-    response.raise_for_status()
+# Method to render the graphs of a service from the RRD files in a worker
+# thread, so that the bot is not blocked in the meantime
+async def iter_rrd_graphs(hostname, service):
+    for graph in await asyncio.to_thread(rrd_renderer.render, hostname, service):
+        yield graph
 
-    # Parse the JSON response into a list of base64-encoded strings
-    # representing images
-    jsonResponse = response.json()
 
-    # Create a list of InputMediaPhoto objects from the decoded images
-    graphs = []
-    for graph in [base64.b64decode(s) for s in jsonResponse]:
-        graphs.append(InputMediaPhoto(graph))
+# Method to get the graphs of a service from the configured renderer. If it
+# fails before any graph was returned, the other renderer is used instead.
+async def iter_service_graphs(hostname, service):
+    if graph_renderer == "rrd":
+        count = 0
+        try:
+            async for graph in iter_rrd_graphs(hostname, service):
+                count += 1
+                yield graph
+        except Exception as e:
+            if count:
+                raise
+            logger.warning("The graphs could not be rendered locally: %s", e)
+
+        if count == 0:
+            async for graph in graph_client.iter_graphs(hostname, service):
+                yield graph
+        return
+
+    count = 0
+    try:
+        async for graph in graph_client.iter_graphs(hostname, service):
+            count += 1
+            yield graph
+    except (httpx.HTTPError, graphs.GraphError) as e:
+        if count or not rrd_renderer.is_available():
+            raise
+        logger.warning("The graphs could not be loaded, rendering locally: %s", e)
+
+        async for graph in iter_rrd_graphs(hostname, service):
+            yield graph
+
+
+# Method to upload the graphs of a service. Every group of graphs is uploaded
+# as soon as it is complete, while the next graphs are still being downloaded.
+# The groups are sent with the given coroutine function, which gets the list
+# of InputMediaPhoto objects. Returns the number of graphs.
+async def upload_service_graphs(hostname, service, send_media_group):
+    cached = graph_cache.get(hostname, service)
+    # Positions of the graphs which are uploaded, all if None
+    retry = None
+    # Number of graphs which were sent by their file IDs
+    sent = 0
+
+    # If the graphs were already uploaded a short time ago, Telegram can send
+    # them again by their file IDs without uploading the images again
+    if cached is not None and cached["file_ids"] is not None:
+        cached_ids = cached["file_ids"]
+        results = await asyncio.gather(
+            *[
+                send_media_group(
+                    [
+                        InputMediaPhoto(file_id)
+                        for file_id in cached_ids[i : i + max_media_chunk_size]
+                    ]
+                )
+                for i in range(0, len(cached_ids), max_media_chunk_size)
+            ],
+            return_exceptions=True,
+        )
+        failed = [
+            index
+            for index, result in enumerate(results)
+            if isinstance(result, Exception)
+        ]
+
+        if not failed:
+            return len(cached_ids)
+
+        # Only the groups which could not be sent are uploaded again, so that
+        # the user does not get the other graphs twice
+        logger.warning("The cached graphs could not be sent: %s", results[failed[0]])
+        retry = {
+            position
+            for index in failed
+            for position in range(
+                index * max_media_chunk_size,
+                min((index + 1) * max_media_chunk_size, len(cached_ids)),
+            )
+        }
+        sent = len(cached_ids) - len(retry)
+
+    # The cached graphs were already compressed before they were stored
+    if cached is not None and cached["graphs"] is not None:
+        source = iter_cached_graphs(cached["graphs"])
+        compress = False
+    elif retry is not None:
+        # The positions of the failed groups are only valid if the service
+        # still has the same number of graphs. Otherwise the cached file IDs
+        # are dropped and all graphs are uploaded again.
+        rendered = [graph async for graph in iter_service_graphs(hostname, service)]
+        if len(rendered) != len(cached_ids):
+            graph_cache.delete(hostname, service)
+            retry = None
+
+        source = iter_cached_graphs(rendered)
+        compress = True
+    else:
+        source = iter_service_graphs(hostname, service)
+        compress = True
+
+    loop = asyncio.get_running_loop()
+    uploads = []
+    chunk = []
+
+    # Method to wait until all graphs of a group are compressed and to upload
+    # them. Returns the graphs and the sent messages.
+    async def upload(chunk):
+        compressed = await asyncio.gather(*chunk)
+        messages = await send_media_group(
+            [InputMediaPhoto(graph) for graph in compressed]
+        )
+        return compressed, messages
+
+    try:
+        position = -1
+        async for graph in source:
+            position += 1
+            if retry is not None and position not in retry:
+                continue
+
+            if compress:
+                chunk.append(
+                    loop.run_in_executor(graph_executor, graphs.compress_graph, graph)
+                )
+            else:
+                future = loop.create_future()
+                future.set_result(graph)
+                chunk.append(future)
+
+            if len(chunk) == max_media_chunk_size:
+                uploads.append(asyncio.create_task(upload(chunk)))
+                chunk = []
+
+        if chunk:
+            uploads.append(asyncio.create_task(upload(chunk)))
+
+        results = await asyncio.gather(*uploads)
+    except BaseException:
+        for upload_task in uploads:
+            upload_task.cancel()
+        raise
+
+    images = [graph for group, _ in results for graph in group]
+    file_ids = [message.photo[-1].file_id for _, group in results for message in group]
+
+    # The new file IDs replace those of the groups which could not be sent
+    if retry is not None:
+        if len(file_ids) == len(retry):
+            merged = list(cached_ids)
+            for position, file_id in zip(sorted(retry), file_ids):
+                merged[position] = file_id
+            graph_cache.set_file_ids(hostname, service, merged)
+
+        return sent + len(images)
+
+    # Remember the file IDs of the uploaded graphs (the largest size of every
+    # photo) for the next requests
+    if compress:
+        graph_cache.put(hostname, service, images, file_ids)
+    else:
+        graph_cache.set_file_ids(hostname, service, file_ids)
+
+    return sent + len(images)
+
+
+# Method to send the graphs of a service to a user. No graphs are prefetched
+# in the meantime, so that the user gets the full capacity of the web server.
+async def send_service_graphs(hostname, service, send_media_group):
+    with graph_prefetcher.pause():
+        return await upload_service_graphs(hostname, service, send_media_group)
+
 
-    # Split the graphs into groups of 10 or fewer, since Telegram's API has a
-    # limit on the number of media items per message
-    max_media_chunk_size = 10
-    chucked_graphs = []
-    for i in range(0, len(graphs), max_media_chunk_size):
-        chucked_graphs.append(graphs[i : i + max_media_chunk_size])
+# Method to load and compress the graphs of a service in the background and
+# to store them in the cache, so that they can be sent without delay when a
+# user requests them
+async def prefetch_service_graphs(hostname, service):
+    loop = asyncio.get_running_loop()
+    images = [graph async for graph in iter_service_graphs(hostname, service)]
+
+    images = await asyncio.gather(
+        *[
+            loop.run_in_executor(graph_executor, graphs.compress_graph, graph)
+            for graph in images
+        ]
+    )
+
+    graph_cache.put(hostname, service, list(images), ttl=graph_prefetch_ttl)
 
-    # Return the chunked graphs
-    return chucked_graphs
+
+# The graphs of critical services are prefetched when the notification is
+# sent, as they are usually requested within the next minutes
+graph_prefetch_ttl = config.getint("check_mk", "graph_prefetch_ttl", fallback=600)
+graph_prefetcher = graphs.GraphPrefetcher(
+    prefetch_service_graphs,
+    graph_cache,
+    client=graph_client,
+    concurrency=config.getint("check_mk", "graph_prefetch_workers", fallback=1),
+    max_latency=config.getfloat("check_mk", "graph_prefetch_latency", fallback=2),
+    logger=logger,
+)
 
 
+@audited()
 async def print_service_graphs(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
@@ -713,14 +1524,15 @@ async def print_service_graphs(
             reply_markup=home_menu,
         )
 
-        # Get the graphs for the specified service on the specified host
-        graphs = get_service_graphs(hostname, service)
+        # Reply to the user with the graphs for the specified service on the
+        # specified host, chunked into groups of 10
+        graph_count = await send_service_graphs(
+            hostname,
+            service,
+            lambda chunk: update.message.reply_media_group(media=chunk),
+        )
 
-        # Reply to the user with the graphs, chunked into groups of 10
-        if len(graphs) > 0:
-            for chunk in graphs:
-                await update.message.reply_media_group(media=chunk)
-        else:
+        if graph_count == 0:
             await update.message.reply_text(
                 translate("No graphs are available"),
                 reply_markup=home_menu,
@@ -741,6 +1553,176 @@ async def print_service_graphs(
     return ConversationHandler.END
 
 
+# Telegram only allows a message to be edited every few seconds, so the
+# output of running commands is shown in steps of this interval
+stream_edit_interval = 2
+# Only the end of long outputs is shown, as a message is limited to 4096
+# characters
+max_stream_output = 3500
+max_message_length = 4096
+
+# Checks are run in the background with a time limit, and only a few of them
+# at the same time, so that the site is not overloaded by many users
+check_timeout = config.getfloat("check_mk", "check_timeout", fallback=120)
+max_concurrent_checks = config.getint("check_mk", "max_concurrent_checks", fallback=4)
+check_semaphore = None
+
+# "cmk" runs the checks with the Check_MK command line tool and shows their
+# output, "livestatus" lets the core schedule them immediately, which also
+# works for hosts of other sites
+recheck_method = config.get("check_mk", "recheck_method", fallback="cmk")
+
+
+def get_check_semaphore():
+    global check_semaphore
+
+    # The semaphore must be created within the running event loop
+    if check_semaphore is None:
+        check_semaphore = asyncio.Semaphore(max_concurrent_checks)
+
+    return check_semaphore
+
+
+# Method to format the (partial) output of a command for a message
+def format_stream_output(title, output, footer=""):
+    output = output.strip() or "..."
+    if len(output) > max_stream_output:
+        output = "...\n" + output[-max_stream_output:]
+
+    return f"{title}\n\n<pre>{html.escape(output)}</pre>\n\n{footer}".strip()
+
+
+# Method to edit a message with the output of a running command. Errors are
+# only logged, as the next edit will show the output again.
+async def edit_stream_message(message, text):
+    try:
+        await message.edit_text(text, parse_mode="HTML")
+    except TelegramError as e:
+        logger.warning("The output message could not be updated: %s", e)
+
+
+# Method to show the home menu again once a message was edited with the result
+# of a command. Messages with a reply keyboard can not be edited, so the
+# edited messages are sent without it and the menu is sent separately.
+async def send_home_menu(message):
+    await message.reply_text(translate("✅ DONE"), reply_markup=home_menu)
+
+
+# Method to run a command without blocking the bot. The output is shown in the
+# given message while the command is running. The command is killed after
+# the timeout. Returns the exit code (None after a timeout) and the output.
+async def run_streamed_command(command, message, title, timeout):
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        # The command gets its own process group, so that the processes it
+        # started can be killed together with it
+        start_new_session=True,
+    )
+    output = ""
+
+    async def read_output():
+        nonlocal output
+        last_edit = time.monotonic()
+
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+
+            output += line.decode("utf-8", errors="replace")
+
+            if time.monotonic() - last_edit >= stream_edit_interval:
+                last_edit = time.monotonic()
+                await edit_stream_message(message, format_stream_output(title, output))
+
+        return await process.wait()
+
+    try:
+        return await asyncio.wait_for(read_output(), timeout), output
+    except asyncio.TimeoutError:
+        return None, output
+    finally:
+        # Make sure that no process is left behind after a timeout or when
+        # the bot is stopped
+        if process.returncode is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+
+# Method to get the name of the site that monitors the host. Hosts which are
+# not known yet are assumed to be on the local site.
+def get_site_name(hostname):
+    for site_name, mirror in livestatus_mirrors.items():
+        if mirror.ready and hostname in mirror.hosts:
+            return site_name
+
+    return omd_site
+
+
+# Method to get the livestatus connection of the site that monitors the host
+def get_site_client(hostname):
+    return livestatus_sites[get_site_name(hostname)]
+
+
+# Method to let the core execute a check immediately, regardless of its
+# normal check interval. Without a description the check of the host itself
+# and, with all_services, the checks of all its services are scheduled.
+async def schedule_forced_check(hostname, description=None, all_services=False):
+    if ";" in hostname or (description is not None and ";" in description):
+        raise ValueError(f"Invalid host or service name: {hostname} {description}")
+
+    now = int(time.time())
+
+    if description is not None:
+        commands = [f"SCHEDULE_FORCED_SVC_CHECK;{hostname};{description};{now}"]
+    else:
+        commands = [f"SCHEDULE_FORCED_HOST_CHECK;{hostname};{now}"]
+        if all_services:
+            commands.append(f"SCHEDULE_FORCED_HOST_SVC_CHECKS;{hostname};{now}")
+
+    await command_writers[get_site_name(hostname)].submit(*commands)
+    return now
+
+
+# Method to wait until the services of a host were checked after the given
+# time. The progress is shown in the message. Returns True if all active
+# checks were executed before the timeout.
+async def wait_for_host_checks(hostname, since, message, title, timeout):
+    client = get_site_client(hostname)
+    query = (
+        Query("services", limit=None)
+        .columns("last_check")
+        .filter("host_name", "=", hostname)
+        .filter("active_checks_enabled", "=", 1)
+    )
+    deadline = time.monotonic() + timeout
+    shown = None
+
+    while True:
+        checks = await client.query_table(query)
+        done = len([check for check in checks if check[0] >= since])
+
+        if done == len(checks):
+            return True
+        if time.monotonic() > deadline:
+            return False
+
+        # The message is only edited if the progress changed
+        if done != shown:
+            shown = done
+            await edit_stream_message(
+                message,
+                f"{title}\n\n⏳ {done}/{len(checks)} {translate('CHECKS COMPLETED')}",
+            )
+        await asyncio.sleep(stream_edit_interval)
+
+
+@audited()
 async def reschedule_check(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -749,26 +1731,315 @@ async def reschedule_check(
     hostname = update.message.text
 
     try:
-        # Reply to the user that we are processing their request
-        await update.message.reply_html(
-            translate("The check will be started. Please wait. ⏳"),
-            reply_markup=home_menu,
+        # Reply to the user that we are processing their request. This
+        # message is then updated with the progress of the check.
+        title = f"<u><b>🔂 {html.escape(hostname)}</b></u>"
+        semaphore = get_check_semaphore()
+        message = await update.message.reply_html(
+            translate(
+                "Other checks are running, the check will be started soon. ⏳"
+                if semaphore.locked()
+                else "The check will be started. Please wait. ⏳"
+            )
         )
 
-        # Execute the check via the CMK CLI and save the output in a variable
-        # to output it to the user afterwards.
-        check_result = subprocess.run(
-            [os.path.join(omd_site_dir, "bin", "cmk"), "--check", hostname],
-            stdout=subprocess.PIPE,
-        )
+        async with semaphore:
+            if recheck_method == "livestatus":
+                since = await schedule_forced_check(hostname, all_services=True)
+                completed = await wait_for_host_checks(
+                    hostname, since, message, title, check_timeout
+                )
+                text = (
+                    f"{await get_host_status(hostname)}\n\n"
+                    + translate(
+                        "RESCHEDULE CHECK WAS COMPLETED SUCCESSFULLY"
+                        if completed
+                        else "NOT ALL CHECKS WERE COMPLETED IN TIME"
+                    )
+                )
+            else:
+                # Execute the check via the CMK CLI. Its output is shown
+                # while the check is running.
+                returncode, output = await run_streamed_command(
+                    [os.path.join(omd_site_dir, "bin", "cmk"), "--check", hostname],
+                    message,
+                    title,
+                    check_timeout,
+                )
+                text = format_stream_output(
+                    title,
+                    output,
+                    translate(
+                        "RESCHEDULE CHECK WAS COMPLETED SUCCESSFULLY"
+                        if returncode is not None
+                        else "THE CHECK WAS CANCELLED AFTER THE TIME LIMIT"
+                    ),
+                )
 
         # Return the answer of the check to the user
-        await update.message.reply_html(
-            f"{check_result.stdout.decode('utf-8')}\n\n"
-            f"{translate('RESCHEDULE CHECK WAS COMPLETED SUCCESSFULLY')}",
+        await message.edit_text(text, parse_mode="HTML")
+        await send_home_menu(update.message)
+
+    except Exception as e:
+        # If an error occurs, print the error and reply with an error message
+        logger.critical(e)
+        await update.message.reply_text(
+            translate(
+                "I'm sorry but while I was processing your request an "
+                "error occurred!"
+            ),
             reply_markup=home_menu,
         )
 
+    # End the conversation handler
+    return ConversationHandler.END
+
+
+# Number of commands which are sent to the core at once by every worker of a
+# bulk recheck
+max_commands_per_submission = 50
+
+
+# Method to get the hosts and services of a hostgroup which are not OK, with
+# one query for the hosts and one for the services, which are sent to all
+# sites at the same time. Passive services are updated by the "Check_MK"
+# service of their host, so this service is checked instead of them. Returns
+# the problems and the checks to execute (both as (host, service or None)
+# pairs) per site, the number of problems which can not be checked, because
+# their names can not be used in a command, and the sites which could not be
+# reached.
+async def query_group_problems(hostgroup):
+    (service_rows, service_errors), (host_rows, host_errors) = await asyncio.gather(
+        livestatus_multisite.query_sites(
+            Query("servicesbyhostgroup", limit=None)
+            .columns("host_name", "description", "active_checks_enabled")
+            .filter("hostgroup_name", "=", hostgroup)
+            .filter("state", "!=", 0)
+        ),
+        livestatus_multisite.query_sites(
+            Query("hostsbygroup", limit=None)
+            .columns("name")
+            .filter("hostgroup_name", "=", hostgroup)
+            .filter("state", "!=", 0)
+        ),
+    )
+
+    problems = {}
+    checks = {}
+    skipped = 0
+
+    for site_name, rows in host_rows.items():
+        for (host_name,) in rows:
+            if ";" in host_name:
+                skipped += 1
+                continue
+
+            problems.setdefault(site_name, set()).add((host_name, None))
+            checks.setdefault(site_name, set()).add((host_name, None))
+
+    for site_name, rows in service_rows.items():
+        for host_name, description, active_checks_enabled in rows:
+            if ";" in host_name or ";" in description:
+                skipped += 1
+                continue
+
+            problems.setdefault(site_name, set()).add((host_name, description))
+            checks.setdefault(site_name, set()).add(
+                (host_name, description if active_checks_enabled else "Check_MK")
+            )
+
+    return problems, checks, skipped, set(service_errors) | set(host_errors)
+
+
+# Method to let the core execute the given checks immediately. The commands
+# are sent in batches by a limited number of workers, so that the core is not
+# flooded with connections.
+async def submit_forced_checks(checks_by_site):
+    now = int(time.time())
+    batches = asyncio.Queue()
+
+    for site_name, checks in checks_by_site.items():
+        commands = sorted(
+            f"SCHEDULE_FORCED_HOST_CHECK;{host_name};{now}"
+            if description is None
+            else f"SCHEDULE_FORCED_SVC_CHECK;{host_name};{description};{now}"
+            for host_name, description in checks
+            if ";" not in host_name and ";" not in (description or "")
+        )
+
+        for i in range(0, len(commands), max_commands_per_submission):
+            batches.put_nowait(
+                (site_name, commands[i : i + max_commands_per_submission])
+            )
+
+    async def work():
+        while not batches.empty():
+            site_name, commands = batches.get_nowait()
+            await command_writers[site_name].submit(*commands)
+
+    await asyncio.gather(
+        *[work() for _ in range(min(max_concurrent_checks, batches.qsize()))]
+    )
+    return now
+
+
+# Method to get the state and the time of the last check of the given hosts
+# and services (as (host, service or None) pairs) of a site, with one query
+# for the hosts and one for the services
+async def query_check_results(site_name, targets):
+    client = livestatus_sites[site_name]
+    results = {}
+
+    host_names = sorted(
+        hostname for hostname, description in targets if description is None
+    )
+    if host_names:
+        query = Query("hosts", limit=None).columns("name", "state", "last_check")
+        for hostname in host_names:
+            query.filter("name", "=", hostname)
+        query.filter_or(len(host_names))
+
+        for hostname, state, last_check in await client.query_table(query):
+            results[(hostname, None)] = (state, last_check)
+
+    services = sorted(
+        (hostname, description)
+        for hostname, description in targets
+        if description is not None
+    )
+    if services:
+        query = Query("services", limit=None).columns(
+            "host_name", "description", "state", "last_check"
+        )
+        for hostname, description in services:
+            query.filter("host_name", "=", hostname)
+            query.filter("description", "=", description)
+            query.filter_and(2)
+        query.filter_or(len(services))
+
+        for hostname, description, state, last_check in await client.query_table(
+            query
+        ):
+            results[(hostname, description)] = (state, last_check)
+
+    return results
+
+
+# Method to wait until the problems of a hostgroup were checked again after
+# the given time. Only the state and the last check of the problems are
+# queried in every round. The progress is shown in the message. Returns the
+# number of problems which are OK now, which are still not OK and which were
+# not checked before the timeout.
+async def wait_for_group_checks(problems, since, message, title):
+    total = sum(len(site_problems) for site_problems in problems.values())
+    deadline = time.monotonic() + check_timeout
+    shown = None
+
+    while True:
+        # A site which can not be reached in this round is asked again in
+        # the next one
+        results = await asyncio.gather(
+            *[
+                query_check_results(site_name, site_problems)
+                for site_name, site_problems in problems.items()
+            ],
+            return_exceptions=True,
+        )
+
+        passed = failed = 0
+        for site_results in results:
+            if isinstance(site_results, Exception):
+                logger.warning("The checks could not be queried: %s", site_results)
+                continue
+
+            for state, last_check in site_results.values():
+                if last_check >= since:
+                    if state == 0:
+                        passed += 1
+                    else:
+                        failed += 1
+
+        pending = total - passed - failed
+        if pending == 0 or time.monotonic() > deadline:
+            return passed, failed, pending
+
+        # The message is only edited if the progress changed
+        if (passed, failed) != shown:
+            shown = (passed, failed)
+            await edit_stream_message(
+                message,
+                f"{title}\n\n"
+                f"⏳ {passed + failed}/{total} {translate('CHECKS COMPLETED')}\n"
+                f"✅ {passed} OK\n"
+                f"🛑 {failed} {translate('STILL FAILING')}",
+            )
+
+        await asyncio.sleep(stream_edit_interval)
+
+
+@audited()
+async def recheck_group_problems(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+) -> int:
+    # Extract hostgroup from user's message
+    hostgroup = update.message.text
+
+    try:
+        # Reply to the user that we are processing their request. This
+        # message is then updated with the progress of the checks.
+        title = f"<u><b>🔁 {html.escape(hostgroup)}</b></u>"
+        message = await update.message.reply_html(
+            translate("The checks will be started. Please wait. ⏳")
+        )
+
+        problems, checks, skipped, unreachable_sites = await query_group_problems(
+            hostgroup
+        )
+        skipped_note = (
+            f"⚠️ {skipped} {translate('CAN NOT BE CHECKED (INVALID NAME)')}\n"
+            if skipped
+            else ""
+        )
+
+        if not problems:
+            await message.edit_text(
+                f"{title}\n\n{translate('There are no problems in this hostgroup')}"
+                + (f"\n{skipped_note}" if skipped else "")
+                + get_unreachable_sites_note(unreachable_sites),
+                parse_mode="HTML",
+            )
+            await send_home_menu(update.message)
+            return ConversationHandler.END
+
+        since = await submit_forced_checks(checks)
+        passed, failed, pending = await wait_for_group_checks(
+            problems, since, message, title
+        )
+
+        # Return the result of the checks to the user
+        summary = (
+            "NOT ALL CHECKS WERE COMPLETED IN TIME"
+            if pending
+            else "RESCHEDULE CHECK WAS COMPLETED SUCCESSFULLY"
+        )
+        await message.edit_text(
+            f"{title}\n\n"
+            f"{translate(summary)}\n\n"
+            f"✅ {passed} OK\n"
+            f"🛑 {failed} {translate('STILL FAILING')}\n"
+            + (
+                f"⏳ {pending} {translate('NOT CHECKED IN TIME')}\n"
+                if pending
+                else ""
+            )
+            + skipped_note
+            + get_unreachable_sites_note(unreachable_sites),
+            parse_mode="HTML",
+        )
+        await send_home_menu(update.message)
+        log_authenticated_access(update.effective_user.username, update.message.text)
+
     except Exception as e:
         # If an error occurs, print the error and reply with an error message
         logger.critical(e)
@@ -784,6 +2055,184 @@ async def reschedule_check(
     return ConversationHandler.END
 
 
+# Duration in seconds of the downtimes which are scheduled via the bot
+downtime_duration = config.getint("check_mk", "downtime_duration", fallback=7200)
+
+
+# Method to check that a host or service name can be used in an external
+# command, in which the arguments are separated by semicolons
+def check_command_argument(value):
+    if value is not None and ";" in value:
+        raise ValueError(f"Invalid host or service name: {value}")
+
+    return value
+
+
+def get_acknowledge_command(hostname, description, author, comment):
+    # Sticky, without notification and not persistent
+    if description is None:
+        return (
+            f"ACKNOWLEDGE_HOST_PROBLEM;{check_command_argument(hostname)};"
+            f"2;0;0;{author};{comment}"
+        )
+
+    return (
+        f"ACKNOWLEDGE_SVC_PROBLEM;{check_command_argument(hostname)};"
+        f"{check_command_argument(description)};2;0;0;{author};{comment}"
+    )
+
+
+def get_downtime_command(hostname, description, author, comment):
+    # A fixed downtime which starts now
+    start = int(time.time())
+    end = start + downtime_duration
+
+    if description is None:
+        return (
+            f"SCHEDULE_HOST_DOWNTIME;{check_command_argument(hostname)};"
+            f"{start};{end};1;0;{downtime_duration};{author};{comment}"
+        )
+
+    return (
+        f"SCHEDULE_SVC_DOWNTIME;{check_command_argument(hostname)};"
+        f"{check_command_argument(description)};"
+        f"{start};{end};1;0;{downtime_duration};{author};{comment}"
+    )
+
+
+# Method to send a command for each of the given hosts and services, as
+# (host, service or None) pairs. The commands of every site are submitted
+# together, so that they are written at once.
+async def submit_commands(targets, get_command, author, comment):
+    commands_by_site = {}
+    for hostname, description in targets:
+        commands_by_site.setdefault(get_site_name(hostname), []).append(
+            get_command(hostname, description, author, comment)
+        )
+
+    await asyncio.gather(
+        *[
+            command_writers[site_name].submit(*commands)
+            for site_name, commands in commands_by_site.items()
+        ]
+    )
+
+
+# Method to get the hosts and services of a site for which the given column
+# (e.g. "acknowledged") is set, with one query for the hosts and one for the
+# services
+async def query_confirmed_targets(site_name, targets, column):
+    client = livestatus_sites[site_name]
+    confirmed = set()
+
+    host_names = sorted(
+        {hostname for hostname, description in targets if description is None}
+    )
+    if host_names:
+        query = Query("hosts", limit=None).columns("name", column)
+        for hostname in host_names:
+            query.filter("name", "=", hostname)
+        query.filter_or(len(host_names))
+
+        for hostname, value in await client.query_table(query):
+            if value:
+                confirmed.add((hostname, None))
+
+    service_hosts = sorted(
+        {hostname for hostname, description in targets if description is not None}
+    )
+    if service_hosts:
+        query = Query("services", limit=None).columns(
+            "host_name", "description", column
+        )
+        for hostname in service_hosts:
+            query.filter("host_name", "=", hostname)
+        query.filter_or(len(service_hosts))
+
+        for hostname, description, value in await client.query_table(query):
+            if value:
+                confirmed.add((hostname, description))
+
+    return confirmed & set(targets)
+
+
+# Method to check whether the commands took effect, by reading back the given
+# column of the hosts and services. The core processes the commands in the
+# background, so this is repeated for a few seconds. Returns the number of
+# hosts and services for which the column is set.
+async def confirm_commands(targets, column, timeout=5):
+    targets_by_site = {}
+    for hostname, description in targets:
+        targets_by_site.setdefault(get_site_name(hostname), set()).add(
+            (hostname, description)
+        )
+
+    deadline = time.monotonic() + timeout
+
+    while True:
+        results = await asyncio.gather(
+            *[
+                query_confirmed_targets(site_name, site_targets, column)
+                for site_name, site_targets in targets_by_site.items()
+            ]
+        )
+        confirmed = sum(len(result) for result in results)
+
+        if confirmed == len(targets) or time.monotonic() > deadline:
+            return confirmed
+
+        await asyncio.sleep(0.5)
+
+
+# Method to acknowledge the problems of the given hosts and services on behalf
+# of a Telegram user. Returns the number of confirmed acknowledgements.
+async def acknowledge_problems(targets, user):
+    await submit_commands(
+        targets,
+        get_acknowledge_command,
+        user.username,
+        "The problem was acknowledged via the Telegram bot by "
+        f"{user.username} ({user.id}).",
+    )
+    return await confirm_commands(targets, "acknowledged")
+
+
+# Method to schedule a downtime for the given hosts and services on behalf of
+# a Telegram user. Returns the number of confirmed downtimes.
+async def schedule_downtimes(targets, user):
+    await submit_commands(
+        targets,
+        get_downtime_command,
+        user.username,
+        "The downtime was scheduled via the Telegram bot by "
+        f"{user.username} ({user.id}).",
+    )
+    return await confirm_commands(targets, "scheduled_downtime_depth")
+
+
+# Method to offer the actions for all problems of a hostgroup below the list
+# of the problems
+async def send_bulk_actions(update, kind, hostgroup):
+    await update.message.reply_text(
+        translate("ACTIONS FOR ALL PROBLEMS"),
+        reply_markup=InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        "✔️ ACKNOWLEDGE ALL",
+                        callback_data=f"bulk,ack,{kind},{hostgroup}",
+                    ),
+                    InlineKeyboardButton(
+                        "🔧 DOWNTIME ALL",
+                        callback_data=f"bulk,downtime,{kind},{hostgroup}",
+                    ),
+                ]
+            ]
+        ),
+    )
+
+
+@audited()
 async def get_host_problems(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -792,39 +2241,33 @@ async def get_host_problems(
         # Query the livestatus connection to get a list of hosts that are in
         # a problematic state and belong to the group specified in the
         # user's message. The resulting list is sorted by host name.
-        host_problems_array = sorted(
-            livestatus_connection.query_table(
-                "GET hostsbygroup\n"
-                "Filter: state = 1\n"  # filter for hosts with a state of warn
-                "Filter: state = 2\n"  # filter for hosts with a state of crit
-                "Filter: state = 3\n"  # filter for hosts with a state of unkn
-                "Or: 3\n"  # combine the three filters above with a logical OR
-                f"Filter: hostgroup_name = {update.message.text}\n"
-                "Columns: name state"  # only return the host name and state
-            ),
-            key=lambda d: d[1],
-            reverse=True,
+        host_problems_array, unreachable_sites = await query_host_problems(
+            update.message.text
         )
+        host_problems_array.sort(key=lambda d: d[1], reverse=True)
 
-        # Create a string to store the host problems and their states.
-        # This string is formatted as HTML for rendering purposes.
-        host_problems = (
+        # Method to format a host and its state as a line of the reply
+        def format_host_problem(row):
+            host, state = row
+            state_emoji, state_text = get_state_details(state)
+            return f"{state_emoji} {host}\n"
+
+        # Send the host problems as a message reply to the user. The message
+        # is formatted as HTML and split into pages if there are many
+        # problems.
+        await send_result_view(
+            update,
+            context,
             f"<u><b>{translate('HOST PROBLEMS')} "
-            f"({len(host_problems_array)}):</b></u>\n\n"
+            f"({len(host_problems_array)}):</b></u>\n\n",
+            host_problems_array,
+            format_host_problem,
+            get_unreachable_sites_note(unreachable_sites),
         )
 
-        # Loop through the list of hosts and their states, and append each one
-        # to the host_problems string.
-        for host, state in host_problems_array:
-            state_emoji, state_text = get_state_details(state)
-            host_problems += f"{state_emoji} {host}\n"
-
-        # Send the host_problems string as a message reply to the user.
-        # The message is formatted as HTML and includes a custom keyboard.
-        await update.message.reply_html(
-            host_problems,
-            reply_markup=home_menu,
-        )
+        # Offer to acknowledge or to schedule a downtime for all problems
+        if host_problems_array:
+            await send_bulk_actions(update, "hosts", update.message.text)
 
     except Exception as e:
         # If an error occurs while processing the user's request, catch
@@ -842,46 +2285,149 @@ async def get_host_problems(
     return ConversationHandler.END
 
 
+@audited()
 async def get_service_problems(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
     try:
         # Get list of services from livestatus connection and sort
         # by description
-        service_problems_array = sorted(
-            livestatus_connection.query_table(
-                "GET servicesbyhostgroup\n"
-                "Filter: state = 1\n"
-                "Filter: state = 2\n"
-                "Filter: state = 3\n"
-                "Or: 3\n"
-                f"Filter: hostgroup_name = {update.message.text}\n"
-                "Columns: host_name description state\n"
-            ),
-            key=lambda d: d[2],
-            reverse=True,
+        service_problems_array, unreachable_sites = await query_service_problems(
+            update.message.text
         )
+        service_problems_array.sort(key=lambda d: d[2], reverse=True)
+
+        # Method to format a service and its state as a line of the reply
+        def format_service_problem(row):
+            host_name, service, state = row
+            state_emoji, state_text = get_state_details(state)
+            return f"{state_emoji}<b>{host_name}</b>: {service}\n"
 
-        service_problems = (
+        # Send the reply message as HTML, split into pages if there are many
+        # problems
+        await send_result_view(
+            update,
+            context,
             f"<u><b>{translate('SERVICE PROBLEMS')} "
-            f"({len(service_problems_array)}):</b></u>\n\n"
+            f"({len(service_problems_array)}):</b></u>\n\n",
+            service_problems_array,
+            format_service_problem,
+            get_unreachable_sites_note(unreachable_sites),
         )
 
-        # Loop through the service problems array and add each service's
-        # status and description to the reply message
-        for host_name, service, state in service_problems_array:
-            state_emoji, state_text = get_state_details(state)
-            service_problems += f"{state_emoji}<b>{host_name}</b>: {service}\n"
+        # Offer to acknowledge or to schedule a downtime for all problems
+        if service_problems_array:
+            await send_bulk_actions(update, "services", update.message.text)
 
-        # Send the reply message as HTML with the home menu as the reply markup
-        await update.message.reply_html(
-            service_problems,
+    except Exception as e:
+        logger.critical(e)
+        # Send an error message with the home menu as the reply markup
+        await update.message.reply_text(
+            translate(
+                "I'm sorry but while I was processing your request an "
+                "error occurred!"
+            ),
             reply_markup=home_menu,
         )
 
+    # End the conversation
+    return ConversationHandler.END
+
+
+@audited()
+async def get_dashboard(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+) -> int:
+    # Check if the user is authenticated
+    if not is_user_authenticated(update.effective_user.id):
+        log_unauthenticated_access(
+            update.effective_user.username,
+            update.message.text,
+        )
+        return ConversationHandler.END
+
+    # Method to let livestatus count the services by state, so that the
+    # answer has the same size no matter how many problems there are
+    def count_services(query):
+        return (
+            query.stats("state", "=", 0)
+            .stats("state", "=", 1)
+            .stats("state", "=", 2)
+            .stats("state", "=", 3)
+            # Unhandled: not OK, not acknowledged and not in a downtime
+            .stats("state", ">", 0)
+            .stats("acknowledged", "=", 0)
+            .stats("scheduled_downtime_depth", "=", 0)
+            .stats_and(3)
+            # Acknowledged problems
+            .stats("state", ">", 0)
+            .stats("acknowledged", "=", 1)
+            .stats_and(2)
+            # Services in a downtime
+            .stats("scheduled_downtime_depth", ">", 0)
+        )
+
+    try:
+        # The totals are counted separately, as a service can be in several
+        # hostgroups or in none at all
+        (site_rows, errors), (total_rows, total_errors) = await asyncio.gather(
+            livestatus_multisite.query_sites(
+                count_services(
+                    Query("servicesbyhostgroup", limit=None).columns("hostgroup_name")
+                )
+            ),
+            livestatus_multisite.query_sites(
+                count_services(Query("services", limit=None))
+            ),
+        )
+        errors = {**errors, **total_errors}
+
+        # Add up the counts of all sites per hostgroup
+        hostgroups = {}
+        for rows in site_rows.values():
+            for hostgroup, *counts in rows:
+                totals = hostgroups.setdefault(hostgroup, [0] * len(counts))
+                for index, count in enumerate(counts):
+                    totals[index] += count
+
+        totals = [0] * 7
+        for rows in total_rows.values():
+            for counts in rows:
+                for index, count in enumerate(counts):
+                    totals[index] += count
+
+        def format_counts(counts):
+            ok, warn, crit, unknown, unhandled, acknowledged, downtime = counts
+            return (
+                f"✅ {ok}  ⚠️ {warn}  🛑 {crit}  🟠 {unknown}\n"
+                f"❗ {unhandled} {translate('UNHANDLED')}  "
+                f"✔️ {acknowledged} {translate('ACKNOWLEDGED')}  "
+                f"💤 {downtime} {translate('IN DOWNTIME')}\n"
+            )
+
+        # Method to format the counts of a hostgroup as lines of the reply
+        def format_hostgroup(row):
+            hostgroup, counts = row
+            return f"\n<b>{hostgroup}</b>\n{format_counts(counts)}"
+
+        # Hostgroups with unhandled problems are shown first
+        await send_result_view(
+            update,
+            context,
+            f"<u><b>📊 {translate('DASHBOARD')}</b></u>\n\n"
+            f"<b>{translate('ALL SERVICES')}</b>\n{format_counts(totals)}",
+            sorted(
+                hostgroups.items(),
+                key=lambda row: (-row[1][4], -row[1][2], row[0]),
+            ),
+            format_hostgroup,
+            get_unreachable_sites_note(errors),
+        )
+        log_authenticated_access(update.effective_user.username, update.message.text)
+
     except Exception as e:
         logger.critical(e)
-        # Send an error message with the home menu as the reply markup
         await update.message.reply_text(
             translate(
                 "I'm sorry but while I was processing your request an "
@@ -890,10 +2436,131 @@ async def get_service_problems(
             reply_markup=home_menu,
         )
 
-    # End the conversation
     return ConversationHandler.END
 
 
+# Method to get the state of a search result as emoji and text
+def get_search_result_state(host_name, description):
+    mirror = find_mirror(host_name)
+    if mirror is None:
+        return "", "???"
+
+    if description is None:
+        # Hosts are either online or offline
+        state = mirror.get_host_state(host_name)
+        return ("✅", "ONLINE") if state == 0 else ("🛑", "OFFLINE")
+
+    return get_state_details(mirror.services[host_name].get(description))
+
+
+# Method to answer inline queries (e.g. "@bot web01 cpu"). The results are
+# shown while the user is typing.
+@audited()
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.inline_query
+
+    # Unauthenticated users do not get any results
+    if not is_user_authenticated(query.from_user.id):
+        await query.answer([], cache_time=0, is_personal=True)
+        return
+
+    results = []
+    for host_name, description in host_search_index.search(query.query, limit=20):
+        state_emoji, state_text = get_search_result_state(host_name, description)
+
+        # The selected result is sent with the same buttons as an automatic
+        # notification, so that the object can be rechecked right away
+        if description is None:
+            name = host_name
+            buttons = [
+                InlineKeyboardButton(
+                    "🔂 RECHECK",
+                    callback_data=f"recheck,HOST STATUS,{host_name},0",
+                )
+            ]
+        else:
+            name = f"{host_name} / {description}"
+            buttons = [
+                InlineKeyboardButton(
+                    "🔂 RECHECK",
+                    callback_data=f"recheck,{description},{host_name},0",
+                ),
+                InlineKeyboardButton(
+                    "📉 GRAPHS",
+                    callback_data=f"graph,{description},{host_name}",
+                ),
+            ]
+
+        results.append(
+            InlineQueryResultArticle(
+                id=str(len(results)),
+                title=f"{state_emoji} {name}",
+                description=state_text,
+                input_message_content=InputTextMessageContent(
+                    f"{state_emoji} {name} - {state_text}"
+                ),
+                reply_markup=InlineKeyboardMarkup([buttons]),
+            )
+        )
+
+    await query.answer(results, cache_time=0, is_personal=True)
+
+
+# Method to search for hosts and services with the /find command
+@audited()
+async def find(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_user_authenticated(update.effective_user.id):
+        log_unauthenticated_access(
+            update.effective_user.username,
+            update.message.text,
+        )
+        return
+
+    try:
+        search = " ".join(context.args)
+
+        if not search:
+            await update.message.reply_text(
+                translate(
+                    "Tell me what you are looking for, e.g. /find web01 cpu"
+                ),
+                reply_markup=home_menu,
+            )
+            return
+
+        # Method to format a search result as a line of the reply
+        def format_search_result(row):
+            host_name, description = row
+            state_emoji, state_text = get_search_result_state(host_name, description)
+
+            if description is None:
+                return f"{state_emoji} <b>{host_name}</b>\n"
+
+            return f"{state_emoji} <b>{host_name}</b> / {description}\n"
+
+        results = host_search_index.search(search, limit=100)
+
+        await send_result_view(
+            update,
+            context,
+            f"<u><b>🔍 {translate('SEARCH RESULTS')} ({len(results)}):</b></u>\n\n",
+            results,
+            format_search_result,
+        )
+        log_authenticated_access(update.effective_user.username, update.message.text)
+
+    except Exception as e:
+        logger.critical(e)
+        await update.message.reply_text(
+            translate(
+                "I'm sorry but while I was processing your request an "
+                "error occurred!"
+            ),
+            reply_markup=home_menu,
+        )
+
+
+@audited()
 async def get_pw_for_auth(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -913,6 +2580,7 @@ async def get_pw_for_auth(
         return ConversationHandler.END
 
 
+@audited(record_target=False)
 async def try_to_authenticate(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -950,6 +2618,7 @@ async def try_to_authenticate(
                 "BE LOGGED 📃 AND COMMUNICATED TO THE OTHER USERS!"
             )
         )
+        set_audit_outcome("denied")
         logger.critical(
             "%s tried to authenticate. The password was wrong.", user.username
         )
@@ -957,6 +2626,7 @@ async def try_to_authenticate(
     return ConversationHandler.END
 
 
+@audited()
 async def get_notification_settings(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
@@ -1001,6 +2671,7 @@ async def get_notification_settings(
         return NOTIFICATION_SETTING
 
 
+@audited()
 async def change_notifications_setting(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
@@ -1051,8 +2722,13 @@ async def change_notifications_setting(
     return ConversationHandler.END
 
 
+@audited()
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if is_user_authenticated(update.effective_user.id):
+        # Stop the questions to the AI which are still being answered
+        for task in list(context.user_data.get("ai_tasks", ())):
+            task.cancel()
+
         await update.message.reply_text(
             translate("Conversation cancelled ❌"),
             reply_markup=home_menu,
@@ -1070,6 +2746,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
 
 
+@audited()
 async def recheck(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Check if the user is authenticated to use the bot
     if is_user_authenticated(update.effective_user.id):
@@ -1082,9 +2759,9 @@ async def recheck(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
             # Call a function to get the status of the server or service
             message = (
-                get_host_status(hostname)
+                await get_host_status(hostname)
                 if description == "HOST STATUS"
-                else get_service_details(hostname, description)
+                else await get_service_details(hostname, description)
             )
 
             # Get the current date and time
@@ -1136,6 +2813,58 @@ async def recheck(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
 
 
+@audited()
+async def show_result_page(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    # Check if the user is authenticated to use the bot
+    if is_user_authenticated(update.effective_user.id):
+        query = update.callback_query
+        await query.answer()
+        type, view_id, page = query.data.split(",")
+
+        try:
+            view = context.user_data.get("result_views", {}).get(int(view_id))
+
+            # Only the latest views are kept, older ones can not be paged
+            if view is None:
+                await query.edit_message_reply_markup(reply_markup=None)
+                await context.bot.send_message(
+                    text=translate(
+                        "This result is no longer available. Please request "
+                        "it again."
+                    ),
+                    chat_id=update.effective_user.id,
+                    reply_markup=home_menu,
+                )
+                return
+
+            text, reply_markup = get_result_page(view, int(view_id), int(page))
+
+            await query.edit_message_text(
+                text=text,
+                reply_markup=reply_markup,
+                parse_mode="HTML",
+            )
+        except Exception as e:
+            # If an error occurs, notify the user
+            logger.critical(e)
+            await context.bot.send_message(
+                text=translate(
+                    "I'm sorry but while I was processing your request an "
+                    "error occurred!"
+                ),
+                chat_id=update.effective_user.id,
+                reply_markup=home_menu,
+            )
+    else:
+        log_unauthenticated_access(
+            update.effective_user.username,
+            update.callback_query.data,
+        )
+
+
+@audited()
 async def post_print_service_graphs(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -1157,16 +2886,17 @@ async def post_print_service_graphs(
                 parse_mode="HTML",
             )
 
-            graphs = get_service_graphs(hostname, description)
+            graph_count = await send_service_graphs(
+                hostname,
+                description,
+                lambda chunk: context.bot.send_media_group(
+                    media=chunk,
+                    chat_id=update.effective_user.id,
+                    disable_notification=True,
+                ),
+            )
 
-            if len(graphs) > 0:
-                for chunk in graphs:
-                    await context.bot.send_media_group(
-                        media=chunk,
-                        chat_id=update.effective_user.id,
-                        disable_notification=True,
-                    )
-            else:
+            if graph_count == 0:
                 await context.bot.send_message(
                     text=translate("No graphs are available"),
                     chat_id=update.effective_user.id,
@@ -1224,6 +2954,11 @@ async def send_automatic_notification(context: ContextTypes.DEFAULT_TYPE):
         f"{translate('HOSTGROUP')}: {hostgroup}\n"
     )
 
+    # Load the graphs of critical services in the background, so that they
+    # are already available when a recipient presses the GRAPHS button
+    if description != "" and get_state_details(to_state)[1] == "CRIT":
+        graph_prefetcher.enqueue(hostname, description)
+
     # Send the message to all the recipients in the recipient list
     for recipient in recipient_list:
         if recipient.isnumeric():
@@ -1232,7 +2967,11 @@ async def send_automatic_notification(context: ContextTypes.DEFAULT_TYPE):
                     InlineKeyboardButton(
                         "🔂 RECHECK",
                         callback_data=f"recheck,{description},{hostname},0",
-                    )
+                    ),
+                    InlineKeyboardButton(
+                        "✔️ ACKNOWLEDGE",
+                        callback_data=f"ack,,{hostname}",
+                    ),
                 ]
             ]
 
@@ -1274,6 +3013,7 @@ async def send_automatic_notification(context: ContextTypes.DEFAULT_TYPE):
             )
 
 
+@audited()
 async def open_admin_settings(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -1284,9 +3024,7 @@ async def open_admin_settings(
             config.read("config.ini")
             user_id = update.effective_user.id
 
-            admin_users = config["telegram_bot"].get("admin_users", "")
-
-            if str(user_id) in admin_users or not admin_users:
+            if is_user_admin(user_id):
                 # Notify the user that their setting has been changed
                 await update.message.reply_text(
                     translate("ADMINISTATOR SETTINGS WERE OPENED"),
@@ -1314,6 +3052,7 @@ async def open_admin_settings(
                             ],
                             [
                                 KeyboardButton(text="⬇ STOP OMD SERVICES"),
+                                KeyboardButton(text="🧾 AUDIT LOG"),
                             ],
                         ],
                         resize_keyboard=False,
@@ -1330,7 +3069,141 @@ async def open_admin_settings(
                 update.effective_user.username, update.message.text
             )
     except Exception as e:
-        # If an error occurs, notify the user
+        # If an error occurs, notify the user
+        logger.critical(e)
+        await update.message.reply_text(
+            translate(
+                "I'm sorry but while I was processing your request an "
+                "error occurred!"
+            ),
+            reply_markup=home_menu,
+        )
+    # End the conversation handler
+    return ConversationHandler.END
+
+
+# Number of log entries which are read for the log viewer, and which are shown
+# on one page. Long entries are shortened, so that a page fits into a message.
+log_view_entries = 200
+log_page_size = 10
+max_log_entry_length = 300
+
+
+# Method to parse the filters of the log viewer, e.g. "warning @alice 24h".
+# Returns the minimum level, the user and the time window in hours.
+def parse_log_filters(arguments):
+    level = user = hours = None
+
+    for argument in arguments:
+        if argument.upper() in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+            level = argument.upper()
+        elif argument.startswith("@"):
+            user = argument[1:]
+        elif argument[:-1].isdigit() and argument[-1:].lower() in ("h", "d"):
+            hours = int(argument[:-1]) * (24 if argument[-1:].lower() == "d" else 1)
+
+    return level, user, hours
+
+
+# Method to send the latest entries of the log file which match the filters
+async def send_log_entries(update, context, level=None, user=None, hours=None):
+    since = datetime.now() - timedelta(hours=hours) if hours else None
+
+    # The log file is read from the end in a worker thread, so that only the
+    # needed part is read and the bot is not blocked in the meantime
+    entries = await asyncio.to_thread(
+        log_reader.tail_entries,
+        log_file_path,
+        log_view_entries,
+        log_backup_count,
+        level,
+        user,
+        since,
+    )
+
+    critical_label, warning_label, title = translate_batch(
+        [
+            "🛑 CRITICAL",
+            "⚠ WARNING",
+            "<u><b>HERE ARE THE LAST LOG ENTRIES</b></u>",
+        ]
+    )
+    labels = {"CRITICAL": critical_label, "WARNING": warning_label}
+
+    def format_entry(entry):
+        message = entry.message
+        if len(message) > max_log_entry_length:
+            message = message[:max_log_entry_length] + "..."
+
+        return (
+            f"<code>{entry.time:%Y-%m-%d %H:%M:%S} "
+            f"{labels.get(entry.level, entry.level)}\n"
+            f"{html.escape(entry.function)}: {html.escape(message)}</code>\n\n"
+        )
+
+    filters_text = " ".join(
+        text
+        for text in (
+            level,
+            f"@{user}" if user else None,
+            f"{hours}h" if hours else None,
+        )
+        if text
+    )
+
+    await send_result_view(
+        update,
+        context,
+        f"{title} ({len(entries)}"
+        f"{', ' + html.escape(filters_text) if filters_text else ''}):\n\n",
+        entries,
+        format_entry,
+        page_size=log_page_size,
+    )
+
+    # Offer the most common filters. Further filters can be given with the
+    # /logs command, e.g. "/logs warning @alice 24h".
+    await update.effective_message.reply_text(
+        translate("FILTER THE LOG ENTRIES"),
+        reply_markup=InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        "🛑 CRITICAL", callback_data="logs,CRITICAL,"
+                    ),
+                    InlineKeyboardButton("⚠ WARNING", callback_data="logs,WARNING,"),
+                ],
+                [
+                    InlineKeyboardButton("🕐 1H", callback_data="logs,,1"),
+                    InlineKeyboardButton("📅 24H", callback_data="logs,,24"),
+                ],
+            ]
+        ),
+    )
+
+
+@audited()
+async def get_logs(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+) -> None:
+    try:
+        if is_user_authenticated(update.effective_user.id) and is_user_admin(
+            update.effective_user.id
+        ):
+            # The filters can be given as arguments of the /logs command
+            level, user, hours = parse_log_filters(context.args or [])
+            await send_log_entries(update, context, level, user, hours)
+
+            log_authenticated_access(
+                update.effective_user.username, update.message.text
+            )
+        else:
+            log_unauthenticated_access(
+                update.effective_user.username, update.message.text
+            )
+
+    except Exception as e:
         logger.critical(e)
         await update.message.reply_text(
             translate(
@@ -1339,37 +3212,145 @@ async def open_admin_settings(
             ),
             reply_markup=home_menu,
         )
-    # End the conversation handler
-    return ConversationHandler.END
 
+    return ConversationHandler.END
 
-async def get_logs(
-    update: Update,
-    context: ContextTypes.DEFAULT_TYPE,
-) -> None:
-    try:
-        if is_user_authenticated(update.effective_user.id):
-            log_path = os.path.join(omd_site_dir, "var", "log")
-            log_file_path = os.path.join(log_path, "telegram-plus.log")
 
-            log_file = open(log_file_path)
-            logs = html.escape(log_file.read())
-            log_file.close()
+@audited()
+async def filter_logs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Check if the user is authenticated to use the admin settings
+    if is_user_authenticated(update.effective_user.id) and is_user_admin(
+        update.effective_user.id
+    ):
+        query = update.callback_query
+        await query.answer()
+        type, level, hours = query.data.split(",")
 
-            events = translate(
-                "<u><b>HERE ARE THE LAST 25 LOG ENTRIES:</b></u>:\n\n",
+        try:
+            await send_log_entries(
+                update, context, level or None, None, int(hours) if hours else None
+            )
+        except Exception as e:
+            logger.critical(e)
+            await query.message.reply_text(
+                translate(
+                    "I'm sorry but while I was processing your request an "
+                    "error occurred!"
+                ),
+                reply_markup=home_menu,
             )
 
-            for event in logs.split("\n")[25:]:
-                event = event.replace("CRITICAL:", translate("🛑 CRITICAL\n"))
-                event = event.replace("WARNING:", translate("⚠ WARNING\n"))
 
-                events += f"<code>{translate(event)}</code>\n\n"
+# Groups of handlers which can be selected together in the audit log, e.g.
+# "/audit acks 24h" for all acknowledgements of the last 24 hours
+audit_command_groups = {
+    "acks": ["acknowledge_service_problem", "bulk_action"],
+    "checks": ["reschedule_check", "recheck_group_problems", "recheck"],
+    "omd": ["get_omd_status", "start_omd_services", "stop_omd_services"],
+    "auth": ["try_to_authenticate"],
+}
+audit_outcomes = {"ok": "✅", "error": "🛑", "denied": "🚫"}
+
+
+# Method to parse the filters of the audit log, e.g. "acks @alice 24h" or
+# "denied". Returns the user, the commands, the outcome and the time window
+# in hours.
+def parse_audit_filters(arguments):
+    user = commands = outcome = None
+    hours = 24
+
+    for argument in arguments:
+        if argument.startswith("@"):
+            user = argument[1:]
+        elif argument.lower() in audit_outcomes:
+            outcome = argument.lower()
+        elif argument.lower() in audit_command_groups:
+            commands = audit_command_groups[argument.lower()]
+        elif argument[:-1].isdigit() and argument[-1:].lower() in ("h", "d"):
+            hours = int(argument[:-1]) * (24 if argument[-1:].lower() == "d" else 1)
+        else:
+            commands = [argument]
+
+    return user, commands, outcome, hours
+
+
+# Method to send the events of the audit log which match the filters
+async def send_audit_events(update, context, user, commands, outcome, hours):
+    # The database is queried in a worker thread. The indexes on the user,
+    # the command and the outcome (each with the time) keep the queries fast.
+    events = await asyncio.to_thread(
+        audit_events.query,
+        time.time() - hours * 3600,
+        user,
+        commands,
+        outcome,
+        log_view_entries,
+    )
 
-            await update.message.reply_html(
-                events,
-                reply_markup=home_menu,
+    def format_event(event):
+        event_time, username, command, target, duration, event_outcome = event
+        return (
+            f"<code>{datetime.fromtimestamp(event_time):%Y-%m-%d %H:%M:%S} "
+            f"{audit_outcomes.get(event_outcome, event_outcome)} "
+            f"@{html.escape(str(username))} {html.escape(command)}"
+            f"{': ' + html.escape(target) if target else ''} "
+            f"({duration:.1f}s)</code>\n\n"
+        )
+
+    filters_text = " ".join(
+        text
+        for text in (
+            f"@{user}" if user else None,
+            ",".join(commands) if commands else None,
+            outcome,
+            f"{hours}h",
+        )
+        if text
+    )
+
+    await send_result_view(
+        update,
+        context,
+        f"<u><b>{translate('AUDIT LOG')}</b></u> "
+        f"({len(events)}, {html.escape(filters_text)}):\n\n",
+        events,
+        format_event,
+        page_size=log_page_size,
+    )
+
+    # Offer the most common queries. Further filters can be given with the
+    # /audit command, e.g. "/audit acks @alice 7d".
+    await update.effective_message.reply_text(
+        translate("FILTER THE AUDIT LOG"),
+        reply_markup=InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton("✔️ ACKS", callback_data="audit,acks"),
+                    InlineKeyboardButton("🔂 CHECKS", callback_data="audit,checks"),
+                ],
+                [
+                    InlineKeyboardButton("🛑 ERRORS", callback_data="audit,error"),
+                    InlineKeyboardButton("🚫 DENIED", callback_data="audit,denied"),
+                ],
+            ]
+        ),
+    )
+
+
+@audited()
+async def get_audit_log(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+) -> None:
+    try:
+        if is_user_authenticated(update.effective_user.id) and is_user_admin(
+            update.effective_user.id
+        ):
+            # The filters can be given as arguments of the /audit command
+            await send_audit_events(
+                update, context, *parse_audit_filters(context.args or [])
             )
+
             log_authenticated_access(
                 update.effective_user.username, update.message.text
             )
@@ -1391,6 +3372,34 @@ async def get_logs(
     return ConversationHandler.END
 
 
+@audited()
+async def filter_audit_log(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    # Check if the user is authenticated to use the admin settings
+    if is_user_authenticated(update.effective_user.id) and is_user_admin(
+        update.effective_user.id
+    ):
+        query = update.callback_query
+        await query.answer()
+        type, arguments = query.data.split(",", 1)
+
+        try:
+            await send_audit_events(
+                update, context, *parse_audit_filters(arguments.split())
+            )
+        except Exception as e:
+            logger.critical(e)
+            await query.message.reply_text(
+                translate(
+                    "I'm sorry but while I was processing your request an "
+                    "error occurred!"
+                ),
+                reply_markup=home_menu,
+            )
+
+
+@audited()
 async def display_password(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -1422,6 +3431,7 @@ async def display_password(
     return ConversationHandler.END
 
 
+@audited()
 async def get_pw(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if is_user_authenticated(update.effective_user.id):
         await update.message.reply_text(translate("What is the password?"))
@@ -1439,6 +3449,7 @@ async def get_pw(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return ConversationHandler.END
 
 
+@audited(record_target=False)
 async def change_password(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -1465,6 +3476,7 @@ async def change_password(
     return ConversationHandler.END
 
 
+@audited()
 async def list_users(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -1508,6 +3520,7 @@ async def list_users(
     return ConversationHandler.END
 
 
+@audited()
 async def get_user(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -1554,6 +3567,7 @@ async def get_user(
     return ConversationHandler.END
 
 
+@audited()
 async def delete_user(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -1580,6 +3594,7 @@ async def delete_user(
     return ConversationHandler.END
 
 
+@audited()
 async def list_notify_queue(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -1620,6 +3635,7 @@ async def list_notify_queue(
     return ConversationHandler.END
 
 
+@audited()
 async def check_for_updates(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -1646,22 +3662,68 @@ async def check_for_updates(
     return ConversationHandler.END
 
 
+# OMD commands can take a minute, so they are run in the background with a
+# time limit. Only one of them may run at the same time.
+omd_timeout = config.getfloat("check_mk", "omd_timeout", fallback=300)
+omd_lock = None
+
+
+def get_omd_lock():
+    global omd_lock
+
+    # The lock must be created within the running event loop
+    if omd_lock is None:
+        omd_lock = asyncio.Lock()
+
+    return omd_lock
+
+
+# Method to run an OMD command (e.g. "status") and to show its output in a
+# message while it is running
+async def run_omd_command(update, action, title):
+    lock = get_omd_lock()
+
+    if lock.locked():
+        await update.message.reply_text(
+            translate(
+                "Another OMD command is still running. Please try again later."
+            ),
+            reply_markup=home_menu,
+        )
+        return
+
+    async with lock:
+        message = await update.message.reply_html(title)
+
+        # Execute the command via the OMD CLI
+        returncode, output = await run_streamed_command(
+            [os.path.join(omd_site_dir, "bin", "omd"), action],
+            message,
+            title,
+            omd_timeout,
+        )
+
+        # Return the answer of the command to the user
+        await message.edit_text(
+            format_stream_output(
+                title,
+                output,
+                ""
+                if returncode is not None
+                else translate("THE COMMAND WAS CANCELLED AFTER THE TIME LIMIT"),
+            ),
+            parse_mode="HTML",
+        )
+        await send_home_menu(update.message)
+
+
+@audited()
 async def get_omd_status(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
 ) -> int:
     try:
-        # Execute the check via the OMD CLI
-        check_result = subprocess.run(
-            [os.path.join(omd_site_dir, "bin", "omd"), "status"],
-            stdout=subprocess.PIPE,
-        )
-
-        # Return the answer of the check to the user
-        await update.message.reply_html(
-            f"<pre>{check_result.stdout.decode('utf-8')}</pre>",
-            reply_markup=home_menu,
-        )
+        await run_omd_command(update, "status", "<u><b>OMD STATUS</b></u>")
 
     except Exception as e:
         # If an error occurs, print the error and reply with an error message
@@ -1678,28 +3740,18 @@ async def get_omd_status(
     return ConversationHandler.END
 
 
+@audited()
 async def start_omd_services(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
 ) -> int:
     try:
-        await update.message.reply_html(
+        await run_omd_command(
+            update,
+            "start",
             translate(
                 "<u><b>THE SERVICES ARE ATTEMPTED TO START. " "PLEASE WAIT</b></u>"
             ),
-            reply_markup=home_menu,
-        )
-
-        # Execute the start command via the OMD CLI
-        check_result = subprocess.run(
-            [os.path.join(omd_site_dir, "bin", "omd"), "start"],
-            stdout=subprocess.PIPE,
-        )
-
-        # Return the answer of the check to the user
-        await update.message.reply_html(
-            f"<pre>{check_result.stdout.decode('utf-8')}</pre>",
-            reply_markup=home_menu,
         )
 
     except Exception as e:
@@ -1717,28 +3769,18 @@ async def start_omd_services(
     return ConversationHandler.END
 
 
+@audited()
 async def stop_omd_services(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
 ) -> int:
     try:
-        await update.message.reply_html(
+        await run_omd_command(
+            update,
+            "stop",
             translate(
                 "<u><b>THE SERVICES ARE ATTEMPTED TO STOP. " "PLEASE WAIT</b></u>"
             ),
-            reply_markup=home_menu,
-        )
-
-        # Execute the stop command via the OMD CLI
-        check_result = subprocess.run(
-            [os.path.join(omd_site_dir, "bin", "omd"), "stop"],
-            stdout=subprocess.PIPE,
-        )
-
-        # Return the answer of the check to the user
-        await update.message.reply_html(
-            f"<pre>{check_result.stdout.decode('utf-8')}</pre>",
-            reply_markup=home_menu,
         )
 
     except Exception as e:
@@ -1756,6 +3798,7 @@ async def stop_omd_services(
     return ConversationHandler.END
 
 
+@audited()
 async def get_language(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -1805,6 +3848,7 @@ async def get_language(
     return ConversationHandler.END
 
 
+@audited()
 async def update_language(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -1831,6 +3875,11 @@ async def update_language(
 
 
 async def message_all_users(context: ContextTypes.DEFAULT_TYPE):
+    await broadcast_message(context.bot, context.job.data)
+
+
+# Method to send a message to all users of the bot at the same time
+async def broadcast_message(bot, text):
     # Read the recipient list for the corresponding notification type from the
     # config file
     config.read("config.ini")
@@ -1849,42 +3898,183 @@ async def message_all_users(context: ContextTypes.DEFAULT_TYPE):
             if recipient != "":
                 recipient_list.append(recipient)
 
-    # Send the message to all the recipients in the recipient list
-    for recipient in recipient_list:
-        if recipient.isnumeric():
-            await context.bot.send_message(
+    # Send the message to all the recipients in the recipient list. A user
+    # who blocked the bot must not prevent the message for everyone else.
+    results = await asyncio.gather(
+        *[
+            bot.send_message(
                 chat_id=recipient,
                 disable_notification=False,
-                text=context.job.data,
+                text=text,
                 reply_markup=home_menu,
                 parse_mode="HTML",
             )
+            for recipient in recipient_list
+            if recipient.isnumeric()
+        ],
+        return_exceptions=True,
+    )
+
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("A message could not be sent to all users: %s", result)
+
+
+# Method to edit a message with the answer of the AI. The Markdown of the AI
+# is not always valid for Telegram, in this case the text is shown as it is.
+async def edit_ai_message(message, text, send=None):
+    send = send or message.edit_text
+
+    try:
+        await send(text, parse_mode="Markdown")
+    except BadRequest:
+        try:
+            await send(text)
+        except TelegramError as e:
+            logger.warning("The answer of the AI could not be shown: %s", e)
+
+
+# Method to show the partial answer of the AI while it is generated
+async def show_partial_ai_answer(message, text):
+    if len(text) > max_stream_output:
+        text = "...\n" + text[-max_stream_output:]
+
+    await edit_stream_message(message, html.escape(text))
+
 
+# Method to show the position of a question which waits for the AI
+async def show_ai_queue_position(message, position):
+    await edit_stream_message(
+        message,
+        f"{translate('Your question is waiting for the AI. Position')}: "
+        f"{position} ⏳",
+    )
+
+
+# Method to ask the AI a question. publish(text) is called with the partial
+# answer while it is generated, so that the first words are visible after
+# about a second. Returns the complete answer.
+async def stream_ai_answer(question, publish):
+    answer = ""
+
+    async def read_answer():
+        nonlocal answer
+        last_edit = 0
+
+        stream = await gpt.chat.completions.create(
+            messages=[{"role": "user", "content": question}],
+            model=config["openai"].get("model", "gpt-4o"),
+            stream=True,
+        )
+
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+
+                answer += chunk.choices[0].delta.content
+
+                if time.monotonic() - last_edit >= stream_edit_interval:
+                    last_edit = time.monotonic()
+                    await publish(answer)
+
+    await asyncio.wait_for(read_answer(), ai_timeout)
+    return answer
+
+
+# Method to answer a question of a user with the AI. The given message is
+# replaced by the translated answer, long answers are continued in further
+# messages. If a signature is given, the answer is taken from the cache or
+# stored in it. The home menu can be sent again after the answer, as the edited
+# message can not contain it.
+async def answer_with_ai(user_id, question, message, signature=None, send_menu=False):
+    async def ask(publish):
+        answer = await stream_ai_answer(question, publish)
+
+        if signature is not None and answer.strip():
+            await asyncio.to_thread(ai_answers.put, signature, answer)
+
+        return answer
 
-def ask_ai(question):
     try:
-        if gpt is not None:
-            return translate(
-                gpt.chat.completions.create(
-                    messages=[{"role": "user", "content": question}],
-                    model=config["openai"].get("model", "gpt-4o"),
+        answer = None
+        if signature is not None:
+            answer = await asyncio.to_thread(ai_answers.get, signature)
+
+        if answer is None:
+            if gpt is None:
+                await message.edit_text(
+                    translate(
+                        "It seems that your AI is not configured. Have you "
+                        "configured the AI as described in the documentation?"
+                    )
                 )
-                .choices[0]
-                .message.content
+                return
+
+            # Questions which only differ in case and whitespace are the same
+            answer = await ai_requests.run(
+                user_id,
+                signature or " ".join(question.lower().split()),
+                ask,
+                functools.partial(show_partial_ai_answer, message),
+                functools.partial(show_ai_queue_position, message),
             )
-        else:
-            return (
-                "It seems that your AI is not configured. Have you "
-                "configured the AI as described in the documentation?"
+
+        # This runs in a worker thread, so the translation can take as long
+        # as the AI may take
+        answer = await asyncio.to_thread(translate_lines, answer, ai_timeout) or "..."
+
+        for i in range(0, len(answer), max_message_length):
+            await edit_ai_message(
+                message,
+                answer[i : i + max_message_length],
+                None if i == 0 else message.reply_text,
             )
+
+        if send_menu:
+            await send_home_menu(message)
+    except asyncio.CancelledError:
+        await edit_stream_message(message, translate("Request cancelled ❌"))
+        raise
+    except ai_scheduler.AIOverloadError as e:
+        await edit_stream_message(message, translate(str(e)))
+    except asyncio.TimeoutError:
+        await edit_stream_message(
+            message,
+            translate(
+                "I'm sorry but the AI did not answer in time. Please try "
+                "again later."
+            ),
+        )
     except Exception as e:
         logger.critical(e)
-        return translate(
-            "I'm sorry but while I was processing your request an "
-            f"error occurred!\n\n({e})"
+        await edit_stream_message(
+            message,
+            translate(
+                "I'm sorry but while I was processing your request an "
+                f"error occurred!\n\n({html.escape(str(e))})"
+            ),
         )
 
 
+# Method to answer a question with the AI in the background, so that the
+# updates of other users are processed in the meantime. The questions of a
+# user can be cancelled with /cancel.
+def start_ai_answer(
+    update, context, question, message, signature=None, send_menu=False
+):
+    tasks = context.user_data.setdefault("ai_tasks", set())
+    task = context.application.create_task(
+        answer_with_ai(
+            update.effective_user.id, question, message, signature, send_menu
+        ),
+        update=update,
+    )
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+
+@audited()
 async def get_ai_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Check if the user is authenticated to use the bot
     if is_user_authenticated(update.effective_user.id):
@@ -1892,9 +4082,14 @@ async def get_ai_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await query.answer()
 
         try:
-            data = query.data.replace("help,", "")
+            # The data of the notification, e.g. "hostname:myhost;service:CPU
+            # load;from_state:OK;to_state:CRIT;output:CRIT - 15-min load 9.1"
+            problem = dict(
+                item.split(":", 1)
+                for item in query.data.replace("help,", "").split(";", 4)
+            )
 
-            await context.bot.send_message(
+            message = await context.bot.send_message(
                 text="I am glad to help you with your problem. "
                 "Let me think for a second. 🤖💭",
                 chat_id=update.effective_user.id,
@@ -1902,18 +4097,26 @@ async def get_ai_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                 parse_mode="HTML",
             )
 
-            ai_response = ask_ai(
+            # The answer is shared by all hosts with the same problem, so the
+            # name of the host is not part of the question
+            start_ai_answer(
+                update,
+                context,
                 "I am experiencing an issue with a service in CheckMK."
                 "Using the following data, please analyze the problem, "
                 "explain the possible causes, and provide potential "
-                f"solutions: {data}"
-            )
-
-            await context.bot.send_message(
-                text=ai_response,
-                chat_id=update.effective_user.id,
-                disable_notification=True,
-                parse_mode="HTML",
+                f"solutions: service:{problem['service']};"
+                f"from_state:{problem['from_state']};"
+                f"to_state:{problem['to_state']};"
+                f"output:{problem['output']}",
+                message,
+                ai_cache.get_signature(
+                    problem["service"],
+                    problem["from_state"],
+                    problem["to_state"],
+                    problem["output"],
+                    problem["hostname"],
+                ),
             )
         except Exception as e:
             # If an error occurs, notify the user
@@ -1928,6 +4131,7 @@ async def get_ai_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             )
 
 
+@audited(record_target=False)
 async def ask_question(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -1936,17 +4140,23 @@ async def ask_question(
         if is_user_authenticated(update.effective_user.id):
             question = update.message.text
 
-            await update.message.reply_text(
-                "... 🤖💭",
-                reply_markup=home_menu,
-            )
+            # Every message outside of a conversation is a question, so make
+            # sure that a password typed in the wrong place is not sent away
+            if question == config["telegram_bot"]["password_for_authentication"]:
+                await update.message.reply_text(
+                    translate(
+                        "This looks like the password of the bot, so it was "
+                        "not sent to the AI."
+                    ),
+                    reply_markup=home_menu,
+                )
+                return
 
-            ai_response = ask_ai(question)
+            # The message is edited with the answer, so it is sent without
+            # the home menu, which follows after the answer
+            message = await update.message.reply_text("... 🤖💭")
 
-            await update.message.reply_markdown(
-                ai_response,
-                reply_markup=home_menu,
-            )
+            start_ai_answer(update, context, question, message, send_menu=True)
 
             log_authenticated_access(
                 update.effective_user.username,
@@ -1969,6 +4179,7 @@ async def ask_question(
         )
 
 
+@audited()
 async def acknowledge_service_problem(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -1977,49 +4188,68 @@ async def acknowledge_service_problem(
         query = update.callback_query
         await query.answer()
         type, description, hostname = query.data.split(",")
-
-        now = int(time.time())
-        nagios_cmd = os.path.join(omd_site_dir, "tmp", "run", "nagios.cmd")
         user = update.effective_user
         username = user.username
 
-        comment = (
-            "ACKNOWLEDGE_SVC_PROBLEM;"
-            f"{hostname};"
-            f"{description};"
-            "2;"
-            "0;"
-            "0;"
-            f"{username};"
-            "The problem was acknowledged via the Telegram bot by "
-            f"{username} ({user.id})."
-        )
+        try:
+            # Notifications about hosts have no service description
+            confirmed = await acknowledge_problems(
+                [(hostname, description or None)], user
+            )
 
-        with open(nagios_cmd, "w") as f:
-            f.write(f"[{now}] {comment}\n")
+            # Only the fixed labels are translated, so that they can be
+            # cached. The options are those of get_acknowledge_command.
+            (
+                title,
+                host_label,
+                service_label,
+                sticky_label,
+                notify_label,
+                persistent_label,
+                confirmed_label,
+                yes,
+                no,
+                acknowledged_label,
+            ) = translate_batch(
+                [
+                    "The service was acknowledged"
+                    if description
+                    else "The host was acknowledged",
+                    "HOST",
+                    "SERVICE",
+                    "STICKY",
+                    "NOTIFY OTHERS",
+                    "PERSISTENT",
+                    "CONFIRMED BY THE CORE",
+                    "YES",
+                    "NO",
+                    "has acknowledged ✅",
+                ]
+            )
 
-        try:
             await context.bot.send_message(
-                text=translate(
-                    "The service was acknowledged:\n\n"
-                    f"HOST: {hostname}\n"
-                    f"SERVICE: {description}\n"
-                    "STICKY: YES\n"
-                    "NOTIFY OTHERS: YES\n"
-                    "PERSISTEN: NO\n"
+                text=(
+                    f"{title}:\n\n"
+                    f"{host_label}: {html.escape(hostname)}\n"
+                    + (
+                        f"{service_label}: {html.escape(description)}\n"
+                        if description
+                        else ""
+                    )
+                    + f"{sticky_label}: {yes}\n"
+                    f"{notify_label}: {no}\n"
+                    f"{persistent_label}: {no}\n"
+                    f"{confirmed_label}: {yes if confirmed else no}\n"
                 ),
                 chat_id=update.effective_user.id,
                 disable_notification=True,
                 parse_mode="HTML",
             )
 
-            bot_handler_job_queue.run_once(
-                message_all_users,
-                0,
-                data=translate(
-                    f"@{username} has acknowledged ✅ the service "
-                    f"'{description}' for the host '{hostname}'"
-                ),
+            await broadcast_message(
+                context.bot,
+                f"@{username} {acknowledged_label}: {html.escape(hostname)}"
+                + (f" / {html.escape(description)}" if description else ""),
             )
 
         except Exception as e:
@@ -2035,6 +4265,63 @@ async def acknowledge_service_problem(
             )
 
 
+@audited()
+async def bulk_action(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Check if the user is authenticated to use the bot
+    if is_user_authenticated(update.effective_user.id):
+        query = update.callback_query
+        await query.answer()
+        # The name of the hostgroup may contain commas itself
+        type, action, kind, hostgroup = query.data.split(",", 3)
+        user = update.effective_user
+
+        try:
+            # The problems are queried again, as they may have changed since
+            # the list was sent
+            if kind == "hosts":
+                rows, unreachable_sites = await query_host_problems(hostgroup)
+                targets = [(row[0], None) for row in rows]
+            else:
+                rows, unreachable_sites = await query_service_problems(hostgroup)
+                targets = [(row[0], row[1]) for row in rows]
+
+            if action == "ack":
+                confirmed = await acknowledge_problems(targets, user)
+                result = translate("PROBLEMS WERE ACKNOWLEDGED")
+            else:
+                confirmed = await schedule_downtimes(targets, user)
+                result = translate("DOWNTIMES WERE SCHEDULED")
+
+            await query.edit_message_text(
+                f"<u><b>{html.escape(hostgroup)}</b></u>\n\n"
+                f"✅ {confirmed}/{len(targets)} {result}\n"
+                f"{get_unreachable_sites_note(unreachable_sites)}",
+                parse_mode="HTML",
+            )
+
+            await broadcast_message(
+                context.bot,
+                f"@{user.username} "
+                + translate(
+                    "has acknowledged ✅ the problems of the hostgroup"
+                    if action == "ack"
+                    else "has scheduled a downtime 🔧 for the problems of the "
+                    "hostgroup"
+                )
+                + f": {html.escape(hostgroup)} ({len(targets)})",
+            )
+
+        except Exception as e:
+            # If an error occurs, notify the user
+            logger.critical(e)
+            await query.edit_message_text(
+                translate(
+                    "I'm sorry but while I was processing your request an "
+                    "error occurred!"
+                )
+            )
+
+
 def main() -> None:
     bot_handler_job_queue.run_once(
         message_all_users,
@@ -2042,6 +4329,16 @@ def main() -> None:
         data=translate("I'm BACK! 🤖"),
     )
 
+    # Keep the state mirror up to date in the background
+    bot_handler_job_queue.run_repeating(
+        refresh_livestatus_mirror,
+        interval=config.getint("check_mk", "state_mirror_interval", fallback=5),
+        first=0,
+    )
+
+    # Write the events of the audit log to its database in batches
+    bot_handler_job_queue.run_repeating(flush_audit_log, interval=5)
+
     version_up_to_date, version_summary = get_bot_version_details()
 
     if not version_up_to_date:
@@ -2055,6 +4352,17 @@ def main() -> None:
     bot_handler.add_handler(CommandHandler("start", start))
     bot_handler.add_handler(CommandHandler("menu", start))
     bot_handler.add_handler(CommandHandler("help", help_command))
+    bot_handler.add_handler(CommandHandler("dashboard", get_dashboard))
+    bot_handler.add_handler(CommandHandler("find", find))
+    bot_handler.add_handler(CommandHandler("logs", get_logs))
+    bot_handler.add_handler(CallbackQueryHandler(filter_logs, pattern="^logs,"))
+    bot_handler.add_handler(CommandHandler("audit", get_audit_log))
+    bot_handler.add_handler(
+        CallbackQueryHandler(filter_audit_log, pattern="^audit,")
+    )
+
+    # Add handler for the search via inline queries (e.g. "@bot web01 cpu")
+    bot_handler.add_handler(InlineQueryHandler(inline_search))
 
     # Add conversation handlers for various commands
     # "⭕ GET HOST STATUS" command
@@ -2183,6 +4491,11 @@ def main() -> None:
         )
     )
 
+    # "📊 DASHBOARD" command
+    bot_handler.add_handler(
+        MessageHandler(filters.Regex("^(📊 DASHBOARD)$"), get_dashboard)
+    )
+
     # "authenticate" command
     bot_handler.add_handler(
         ConversationHandler(
@@ -2240,9 +4553,13 @@ def main() -> None:
                         get_service_name,
                     )
                 ],
+                # Loading and uploading the graphs can take a while, so it does
+                # not block the updates of other users
                 SERVICE: [
                     MessageHandler(
-                        filters.TEXT & (~filters.COMMAND), print_service_graphs
+                        filters.TEXT & (~filters.COMMAND),
+                        print_service_graphs,
+                        block=False,
                     )
                 ],
             },
@@ -2250,7 +4567,8 @@ def main() -> None:
         )
     )
 
-    # "🔄 RESCHEDULE CHECK" command
+    # "🔄 RESCHEDULE CHECK" command. Checks and OMD commands can take minutes,
+    # so their handlers do not block the updates of other users.
     bot_handler.add_handler(
         ConversationHandler(
             entry_points=[
@@ -2270,6 +4588,7 @@ def main() -> None:
                     MessageHandler(
                         filters.TEXT & (~filters.COMMAND),
                         reschedule_check,
+                        block=False,
                     )
                 ],
             },
@@ -2277,6 +4596,28 @@ def main() -> None:
         )
     )
 
+    # "🔁 RECHECK ALL PROBLEMS" command
+    bot_handler.add_handler(
+        ConversationHandler(
+            entry_points=[
+                MessageHandler(
+                    filters.Regex("^(🔁 RECHECK ALL PROBLEMS)$"),
+                    get_host_group,
+                )
+            ],
+            states={
+                HOSTGROUP: [
+                    MessageHandler(
+                        filters.TEXT & (~filters.COMMAND),
+                        recheck_group_problems,
+                        block=False,
+                    )
+                ]
+            },
+            fallbacks=[CommandHandler("cancel", cancel)],
+        )
+    )
+
     # "⚙️ ADMIN SETTINGS" command
     bot_handler.add_handler(
         ConversationHandler(
@@ -2290,6 +4631,11 @@ def main() -> None:
         )
     )
 
+    # "🧾 AUDIT LOG" command
+    bot_handler.add_handler(
+        MessageHandler(filters.Regex("^(🧾 AUDIT LOG)$"), get_audit_log)
+    )
+
     # "📖 GET LOGS" command
     bot_handler.add_handler(
         ConversationHandler(
@@ -2395,6 +4741,7 @@ def main() -> None:
                 MessageHandler(
                     filters.Regex("^(✴ GET OMD STATUS)$"),
                     get_omd_status,
+                    block=False,
                 )
             ],
             states={},
@@ -2409,6 +4756,7 @@ def main() -> None:
                 MessageHandler(
                     filters.Regex("^(⬆ START OMD SERVICES)$"),
                     start_omd_services,
+                    block=False,
                 )
             ],
             states={},
@@ -2423,6 +4771,7 @@ def main() -> None:
                 MessageHandler(
                     filters.Regex("^(⬇ STOP OMD SERVICES)$"),
                     stop_omd_services,
+                    block=False,
                 )
             ],
             states={},
@@ -2451,21 +4800,43 @@ def main() -> None:
         )
     )
 
+    # /cancel outside of a conversation cancels the questions to the AI
+    bot_handler.add_handler(CommandHandler("cancel", cancel))
+
+    # Messages which were sent via the inline search are not questions
     bot_handler.add_handler(
-        MessageHandler(filters.TEXT & (~filters.COMMAND), ask_question)
+        MessageHandler(
+            filters.TEXT & (~filters.COMMAND) & (~filters.VIA_BOT), ask_question
+        )
     )
 
     # Add callback handler for "🔂 RECHECK" button
     bot_handler.add_handler(CallbackQueryHandler(recheck, pattern="^recheck,"))
 
+    # Add callback handler for the "◀️ PREV" and "NEXT ▶️" buttons
+    bot_handler.add_handler(
+        CallbackQueryHandler(show_result_page, pattern="^page,")
+    )
+
     # Add callback handler for "📉 GET SERVICE GRAPHS" button
     bot_handler.add_handler(
-        CallbackQueryHandler(post_print_service_graphs, pattern="^graph,")
+        CallbackQueryHandler(
+            post_print_service_graphs, pattern="^graph,", block=False
+        )
+    )
+
+    # Add callback handler for "✔️ ACKNOWLEDGE" button. The commands are
+    # confirmed and announced to all users, so the handlers do not block the
+    # updates of other users in the meantime.
+    bot_handler.add_handler(
+        CallbackQueryHandler(
+            acknowledge_service_problem, pattern="^ack,", block=False
+        )
     )
 
-    # Add callback handler for "✔️ ACKNOWLEDGE" button
+    # Acknowledge or schedule a downtime for all problems of a hostgroup
     bot_handler.add_handler(
-        CallbackQueryHandler(acknowledge_service_problem, pattern="^ack,")
+        CallbackQueryHandler(bulk_action, pattern="^bulk,", block=False)
     )
 
     # Add callback handler for "🆘 HELP" button
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "resources"))
+
+import ai_scheduler  # noqa: E402
+
+
+async def answer(publish):
+    return "answer"
+
+
+class AISchedulerTest(unittest.IsolatedAsyncioTestCase):
+    # Starts a slow request of bob, which occupies the only slot, and queues
+    # the given requests of alice behind it. Returns the scheduler, the event
+    # which finishes the slow request and the tasks of the requests.
+    async def start_requests(self, *keys):
+        scheduler = ai_scheduler.AIScheduler(concurrency=1)
+        release = asyncio.Event()
+
+        async def slow_answer(publish):
+            await release.wait()
+            return "slow"
+
+        running = asyncio.create_task(scheduler.run("bob", "running", slow_answer))
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(scheduler.run("alice", key, answer)) for key in keys
+        ]
+        await asyncio.sleep(0)
+
+        return scheduler, release, running, tasks
+
+    # The slot of the slow request is passed to the first request of alice,
+    # which is cancelled before its task resumes (e.g. by /cancel)
+    async def cancel_after_dispatch(self, scheduler, release, running, key):
+        release.set()
+        await asyncio.sleep(0)
+
+        request = scheduler.requests[key]
+        self.assertTrue(request.started.done())
+        request.task.cancel()
+
+        self.assertEqual(await running, "slow")
+
+    async def test_cancel_after_dispatch_frees_the_slot(self):
+        scheduler, release, running, (first,) = await self.start_requests("first")
+        await self.cancel_after_dispatch(scheduler, release, running, "first")
+
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+        self.assertEqual(scheduler.running, 0)
+        self.assertEqual(scheduler.requests, {})
+
+        # Later requests still get the slot
+        result = await asyncio.wait_for(scheduler.run("alice", "next", answer), 1)
+        self.assertEqual(result, "answer")
+        self.assertEqual(scheduler.running, 0)
+
+    async def test_cancel_after_dispatch_keeps_other_waiting_requests(self):
+        scheduler, release, running, (first, second) = await self.start_requests(
+            "first", "second"
+        )
+        await self.cancel_after_dispatch(scheduler, release, running, "first")
+
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+        self.assertEqual(await asyncio.wait_for(second, 1), "answer")
+        self.assertEqual(scheduler.running, 0)
+        self.assertEqual(len(scheduler.waiting), 0)
+
+    async def test_cancel_while_waiting(self):
+        scheduler, release, running, (waiting,) = await self.start_requests(
+            "waiting"
+        )
+
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+
+        release.set()
+        self.assertEqual(await running, "slow")
+        self.assertEqual(scheduler.running, 0)
+        self.assertEqual(scheduler.requests, {})
+        self.assertEqual(len(scheduler.waiting), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()